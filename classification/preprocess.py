@@ -21,41 +21,51 @@ if len(sys.argv) != 3:
 
 import pandas as pd
 
+# number of labels read from disk at once
+CHUNK_SIZE = 100_000
 
-def preprocess(source_dir: str, destination_dir: str):
 
-    labels = pd.read_csv(os.path.join(source_dir, "labels.csv"))
-    fragments = pd.read_csv(os.path.join(source_dir, "fragments.csv"))
+def preprocess(source_dir: str, destination_dir: str, chunk_size: int = CHUNK_SIZE):
 
-    paired_index = []
-    paired_labels = []
-    paired_kind = []
-
-    # sort fragments according to id
-    # id starts at 1
-    fragments.sort_values(by=["unique_id"], inplace=True)
-
-    # iterate through labels
-    for index, label in labels.iterrows():
-        paired_index.append(label["id"])
-
-        tokenize = label["label"]
-
-        paired_labels.append(tokenize)
-
-        fragment = fragments.iloc[label["fragment_id"] - 1]
-
-        # open fragment plantuml code
-        kind = fragment["kind"]
+    # only the kind of each fragment is needed, keyed by its unique id
+    fragments = pd.read_csv(
+        os.path.join(source_dir, "fragments.csv"), usecols=["unique_id", "kind"]
+    )
 
-        paired_kind.append(kind)
+    os.makedirs(destination_dir, exist_ok=True)
+    destination = os.path.join(destination_dir, "fragment_kinds.csv")
 
-    # output
-    paired = pd.DataFrame(
-        data={"english": paired_labels, "kind": paired_kind}, index=paired_index
+    # stream the labels in chunks, joining each chunk to its fragment kinds
+    labels = pd.read_csv(
+        os.path.join(source_dir, "labels.csv"),
+        usecols=["id", "fragment_id", "label"],
+        chunksize=chunk_size,
     )
-    os.makedirs(destination_dir, exist_ok=True)
-    paired.to_csv(os.path.join(destination_dir, "fragment_kinds.csv"))
+
+    chunk_index = -1
+    for chunk_index, chunk in enumerate(labels):
+        # a left merge keeps the order of the labels
+        paired = chunk.merge(
+            fragments, how="left", left_on="fragment_id", right_on="unique_id"
+        )
+
+        # output
+        paired = pd.DataFrame(
+            data={
+                "english": paired["label"].values,
+                "kind": paired["kind"].values,
+            },
+            index=paired["id"].values,
+        )
+        paired.to_csv(
+            destination,
+            mode="w" if chunk_index == 0 else "a",
+            header=chunk_index == 0,
+        )
+
+    # no labels at all, still write the header
+    if chunk_index == -1:
+        pd.DataFrame(columns=["english", "kind"]).to_csv(destination)
 
 
 preprocess(sys.argv[1], sys.argv[2])
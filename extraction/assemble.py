@@ -1,13 +1,449 @@
 """
 Take the fragments and put them together
 """
+from concurrent.futures import ProcessPoolExecutor
 from typing import Tuple
 from .utils import uml
+from .utils.fuzzy import NameIndex
+
+
+# irregular plurals folded to their singular by class_key
+IRREGULAR_PLURALS = {
+    "people": "person",
+    "children": "child",
+    "men": "man",
+    "women": "woman",
+    "mice": "mouse",
+    "feet": "foot",
+    "teeth": "tooth",
+    "geese": "goose",
+}
+
+# singular words that end like plurals, kept as they are by class_key, also
+# at the end of a longer name like "ImageCanvas"
+NON_PLURALS = (
+    "alias",
+    "atlas",
+    "bias",
+    "canvas",
+    "gas",
+    "news",
+    "series",
+    "species",
+    "means",
+    "lens",
+    "physics",
+    "mathematics",
+    "economics",
+    "electronics",
+)
+
+
+# attribute names looked at per fuzzy match of a class name
+FUZZY_CANDIDATES = 8
+
+
+def class_key(name: str) -> str:
+    """
+    Normalized form of a class name: case, separators and plurals are folded,
+    so that "Category", "categories" and "CATEGORY" share a key. Singular
+    words ending in "ss", "us", "is" or listed in NON_PLURALS, like "Status"
+    or "Canvas", keep their "s".
+
+    Rule based rather than through the spacy lemmatizer, assembly stays
+    dependency free and fast.
+    """
+    key = "".join(character for character in name.lower() if character.isalnum())
+
+    # nothing left to fold, "_" and "?" stay different classes
+    if key == "":
+        return name.lower()
+
+    if key in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[key]
+
+    # plurals
+    if key.endswith(NON_PLURALS):
+        pass
+    elif len(key) > 4 and key.endswith("ies"):
+        key = key[:-2]
+    elif len(key) > 4 and key.endswith(("sses", "xes", "zes", "ches", "shes")):
+        key = key[:-2]
+    elif len(key) > 3 and key.endswith("s") and not key.endswith(("ss", "us", "is")):
+        key = key[:-1]
+
+    # category / categori(es), movie / movi(es)
+    if len(key) > 3 and key.endswith("ie"):
+        key = key[:-1]
+    elif len(key) > 2 and key.endswith("y"):
+        key = key[:-1] + "i"
+
+    return key
+
+
+class ClassIdentity:
+    """
+    Union-find over normalized class keys, decides which names denote the
+    same class.
+
+    Names sharing a key (see class_key) are the same class. Other decisions,
+    like a fuzzy match, join two keys with union().
+    """
+
+    def __init__(self) -> None:
+        # key -> parent key
+        self.parent: dict[str, str] = {}
+
+    def copy(self) -> "ClassIdentity":
+        copied = ClassIdentity()
+        copied.parent = dict(self.parent)
+        return copied
+
+    def _find(self, key: str) -> str:
+        parent = self.parent
+        while parent[key] != key:
+            # path halving
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    def find(self, name: str):
+        """
+        Identity of a name, None if no name of that key was added
+        """
+        key = class_key(name)
+        if key not in self.parent:
+            return None
+        return self._find(key)
+
+    def add(self, name: str) -> str:
+        """
+        Adds a name if needed and returns its identity
+        """
+        key = class_key(name)
+        if key not in self.parent:
+            self.parent[key] = key
+            return key
+        return self._find(key)
+
+    def union(self, first_name: str, second_name: str) -> str:
+        """
+        Makes two names the same class. Returns the identity of the first one,
+        which is kept as the identity of both.
+        """
+        first = self.add(first_name)
+        second = self.add(second_name)
+        if first != second:
+            self.parent[second] = first
+        return first
+
+
+class ClassIndex:
+    """
+    Lookups over the classes of a model being assembled.
+
+    The indexes are updated as classes are added and merged, so matching an
+    incoming fragment does not scan every class and attribute of the model.
+
+    With a fuzzy threshold, class and attribute names are also matched by
+    similarity (see utils.fuzzy), names at least that similar denote the
+    same thing.
+    """
+
+    def __init__(
+        self,
+        model: uml.UML,
+        identity: ClassIdentity = None,
+        fuzzy_threshold: float = None,
+    ) -> None:
+        self.model = model
+        self.identity = identity if identity is not None else ClassIdentity()
+        self.fuzzy_threshold = fuzzy_threshold
+
+        # similarity indexes over class keys and attribute keys
+        self.class_names: NameIndex = None
+        self.attribute_names: NameIndex = None
+        if fuzzy_threshold is not None:
+            self.class_names = NameIndex(fuzzy_threshold, normalize=class_key)
+            self.attribute_names = NameIndex(fuzzy_threshold, normalize=class_key)
+
+        # identity -> first class of the model with that identity
+        self.by_identity: dict[str, uml.UMLClass] = {}
+        # attribute key -> classes that had that attribute, may be stale
+        self.attribute_owners: dict[str, list[uml.UMLClass]] = {}
+        # id of a class -> position in the model
+        self.positions: dict[int, int] = {}
+        # (source identity, destination identity, name) -> (source class, position
+        # of the association in its list)
+        self.edges: dict[Tuple[str, str, str], Tuple[uml.UMLClass, int]] = {}
+        # identity -> keys of the edges at either end, may be stale
+        self.edge_keys: dict[str, list[Tuple[str, str, str]]] = {}
+
+        for position, uml_class in enumerate(model.classes):
+            self._index_class(uml_class, position)
+
+    def copy(self) -> "ClassIndex":
+        """
+        Index over a copy of the model, see uml.UML.copy()
+        """
+        return ClassIndex(
+            self.model.copy(), self.identity.copy(), self.fuzzy_threshold
+        )
+
+    def append(self, uml_class: uml.UMLClass):
+        """
+        Adds a class to the model
+        """
+        self.model.classes.append(uml_class)
+        self._index_class(uml_class, len(self.model.classes) - 1)
+
+    def _index_class(self, uml_class: uml.UMLClass, position: int):
+        identity = self.identity.add(uml_class.name)
+        self.by_identity.setdefault(identity, uml_class)
+        self.positions[id(uml_class)] = position
+        if self.class_names is not None:
+            self.class_names.add(uml_class.name, uml_class)
+        self.index_attributes(uml_class)
+
+        for association_position, association in enumerate(uml_class.associations):
+            self._add_edge(
+                self._edge_key(uml_class, association[0], association[2]),
+                (uml_class, association_position),
+            )
+
+    def _edge_key(self, source: uml.UMLClass, destination: uml.UMLClass, name: str):
+        return (
+            self.identity.add(source.name),
+            self.identity.add(destination.name),
+            name,
+        )
+
+    def _add_edge(self, key: Tuple[str, str, str], edge: Tuple[uml.UMLClass, int]):
+        # the first association of a key stays
+        if key in self.edges:
+            return
+        self.edges[key] = edge
+        self.edge_keys.setdefault(key[0], []).append(key)
+        if key[1] != key[0]:
+            self.edge_keys.setdefault(key[1], []).append(key)
+
+    def _rekey_edges(self, old: str, identity: str):
+        # the edges of an identity merged into another one, under the new identity
+        for key in self.edge_keys.pop(old, []):
+            if key[0] != old and key[1] != old:
+                continue
+            edge = self.edges.pop(key, None)
+            if edge is None:
+                continue
+            source, destination, name = key
+            self._add_edge(
+                (
+                    identity if source == old else source,
+                    identity if destination == old else destination,
+                    name,
+                ),
+                edge,
+            )
+
+    def associate(
+        self,
+        source: uml.UMLClass,
+        destination: uml.UMLClass,
+        multiplicity: str = "",
+        name: str = "",
+    ):
+        """
+        Adds an association, or merges it into the existing association of the
+        same source, destination and name
+        """
+        key = self._edge_key(source, destination, name)
+        existing = self.edges.get(key)
+
+        if existing is None:
+            source.association(destination, multiplicity, name)
+            self._add_edge(key, (source, len(source.associations) - 1))
+            return
+
+        # multiplicity takes over no multiplicity, otherwise the existing one stays
+        existing_source, association_position = existing
+        association = existing_source.associations[association_position]
+        if association.multiplicity == "" and multiplicity != "":
+            existing_source.associations[association_position] = association._replace(
+                multiplicity=multiplicity
+            )
+
+    def lookup(self, name: str):
+        """
+        The class of the model with the same identity as this name, or None
+        """
+        identity = self.identity.find(name)
+        if identity is None:
+            return None
+        return self.by_identity.get(identity)
+
+    def similar_class(self, name: str):
+        """
+        The class of the model with the name most similar to this one, above
+        the fuzzy threshold, or None. Always None without a fuzzy threshold.
+        """
+        if self.class_names is None:
+            return None
+
+        for _, _, classes in self.class_names.query(name, k=1):
+            # the class may have been merged into another one since
+            return self.lookup(classes[0].name)
+        return None
+
+    def resolve(self, name: str):
+        """
+        Like lookup, falling back to the most similar class. A similar class
+        becomes the identity of the name.
+        """
+        existing_class = self.lookup(name)
+        if existing_class is not None:
+            return existing_class
+
+        existing_class = self.similar_class(name)
+        if existing_class is not None:
+            self.union(existing_class.name, name)
+        return existing_class
+
+    def union(self, first_name: str, second_name: str):
+        """
+        Makes two names of the model the same class
+        """
+        first = self.identity.find(first_name)
+        second = self.identity.find(second_name)
+        identity = self.identity.union(first_name, second_name)
+
+        # the earliest class of the two identities stays the representative
+        candidates = [
+            self.by_identity[old]
+            for old in (first, second)
+            if old is not None and old in self.by_identity
+        ]
+        for old in (first, second):
+            self.by_identity.pop(old, None)
+        if len(candidates) != 0:
+            self.by_identity[identity] = min(
+                candidates, key=lambda candidate: self.positions[id(candidate)]
+            )
+
+        # edge keys hold identities, those of the merged identity would not match
+        for old in (first, second):
+            if old is not None and old != identity:
+                self._rekey_edges(old, identity)
+
+    def index_attributes(self, uml_class: uml.UMLClass, attributes=None):
+        """
+        Call after attributes were added to a class of the model, with the
+        added attributes. All the attributes of the class by default.
+        """
+        if attributes is None:
+            attributes = uml_class.attributes
+
+        for name, _ in attributes:
+            self.attribute_owners.setdefault(class_key(name), []).append(uml_class)
+            if self.attribute_names is not None:
+                self.attribute_names.add(name)
+
+    def attribute_keys(self, name: str) -> set[str]:
+        """
+        Keys of the attributes that match this name: its own key, and the
+        similar attribute keys with a fuzzy threshold
+        """
+        keys = {class_key(name)}
+        if self.attribute_names is not None:
+            keys.update(
+                key
+                for _, key, _ in self.attribute_names.query(name, k=FUZZY_CANDIDATES)
+            )
+        return keys
+
+    def owners_of_attribute(
+        self, name: str, keys: set[str] = None
+    ) -> list[uml.UMLClass]:
+        """
+        Classes holding an attribute that matches this name (see attribute_keys),
+        in model order
+        """
+        if keys is None:
+            keys = self.attribute_keys(name)
+
+        owners: dict[int, uml.UMLClass] = {}
+        for key in keys:
+            candidates = self.attribute_owners.get(key)
+            if not candidates:
+                continue
+
+            current: dict[int, uml.UMLClass] = {}
+            for candidate in candidates:
+                if id(candidate) in current:
+                    continue
+                if any(
+                    class_key(attribute[0]) == key
+                    for attribute in candidate.attributes
+                ):
+                    current[id(candidate)] = candidate
+
+            # drop the stale entries
+            self.attribute_owners[key] = list(current.values())
+            owners.update(current)
 
+        return sorted(owners.values(), key=lambda owner: self.positions[id(owner)])
 
-def assemble(fragments: list[uml.UML]):
+
+def canonical_model(index: ClassIndex) -> uml.UML:
+    """
+    Builds the final model of an assembly: one class per identity, named after
+    the first class of that identity, with the attributes of all its classes
+    merged by merge_attributes and the relationships deduplicated per source,
+    destination and name.
+
+    Linear in the size of the model.
+    """
+    model = index.model
+    identity = index.identity
+
+    # identity -> canonical class
+    canonical: dict[str, uml.UMLClass] = {}
+
+    def canonical_identity(name: str) -> str:
+        class_identity = identity.add(name)
+        if class_identity not in canonical:
+            representative = index.by_identity.get(class_identity)
+            canonical[class_identity] = uml.UMLClass(
+                representative.name if representative is not None else name, "class"
+            )
+        return class_identity
+
+    for uml_class in model.classes:
+        class_identity = canonical_identity(uml_class.name)
+        merge_attributes(uml_class, canonical[class_identity])
+
+    # (source, destination, name) -> association
+    relationships: dict[Tuple[str, str, str], AssociationRecord] = {}
+
+    for uml_class in model.classes:
+        get_unique_relationships(relationships, uml_class, canonical_identity)
+
+    # link all the relationships
+    for relation in relationships.values():
+        canonical[relation.source].association(
+            canonical[relation.destination], relation.multiplicity, relation.name
+        )
+
+    canonical_uml = uml.UML(model.package_name)
+    canonical_uml.classes = list(canonical.values())
+    return canonical_uml
+
+
+def assemble(fragments: list[uml.UML], fuzzy_threshold: float = None):
     """
     Simple greedy algorithm
+
+    With a fuzzy threshold, classes and attributes with similar names are
+    merged too, see ClassIndex.
     """
     # first not none fragment
     try:
@@ -17,7 +453,9 @@ def assemble(fragments: list[uml.UML]):
 
     # trivial case
     if len(fragments) == 1:
-        return remove_duplicates(model_in_progress)
+        return canonical_model(
+            ClassIndex(model_in_progress, None, fuzzy_threshold)
+        )
 
     # re-order the fragments to start with classes
     incoming_classes = []
@@ -32,177 +470,372 @@ def assemble(fragments: list[uml.UML]):
             incoming_rels.append(fragment)
     fragments = incoming_classes + incoming_rels
 
+    # the assembly starts from the first fragment of this order, the first
+    # fragment given can be a rel that is merged later like the others
+    package_name = model_in_progress.package_name
+    model_in_progress = fragments[0]
+
+    index = ClassIndex(model_in_progress, None, fuzzy_threshold)
+
     for incoming_fragment in fragments[1:]:
 
         # class fragment
         if len(incoming_fragment.classes) == 1:
-            incoming_class = incoming_fragment.classes[0]
+            merge_class_fragment(index, incoming_fragment.classes[0])
 
-            # check for existing similarities
+        # rel fragment
+        else:
+            merge_rel_fragment(index, incoming_fragment)
 
-            # direct match
-            existing_class = None
-            existing_source_class_index = -1
-            for index, m in enumerate(model_in_progress.classes):
-                if m.name == incoming_class.name:
-                    existing_class = m
-                    existing_source_class_index = index
-            if existing_class is not None:
+    assembled = canonical_model(index)
+    assembled.package_name = package_name
+    return assembled
 
-                merged_attributes = merge_attributes(incoming_class, existing_class)
 
-                existing_class.attributes = merged_attributes
-                model_in_progress.classes[existing_source_class_index] = existing_class
-                continue
+class Assembler:
+    """
+    Incremental assembly, for fragments that arrive one at a time.
+
+    Class fragments are merged as soon as they are added. A rel fragment is
+    merged once both of its classes are in the model, until then it waits.
+    With a fuzzy threshold, a class with a name similar enough to a missing
+    one releases the rels waiting for it too. snapshot() gives the assembled
+    model at any point: waiting rels are resolved on a copy the same way
+    assemble() resolves them.
+    """
 
-            # indirect match
-            result = indirect_matching_class(model_in_progress, incoming_class)
-            if result is not None:
+    def __init__(self, fuzzy_threshold: float = None) -> None:
+        self.fuzzy_threshold = fuzzy_threshold
+        self.model: uml.UML = None
+        self.index: ClassIndex = None
+
+        # id -> rel fragment still waiting for a class, in arrival order
+        self.waiting_rels: dict[int, uml.UML] = {}
+        # class key -> rel fragments waiting for it
+        self._waiting_for: dict[str, list[uml.UML]] = {}
+        # names of the missing classes, to find the ones a class matches fuzzily
+        self._waiting_names: NameIndex = None
+        if fuzzy_threshold is not None:
+            self._waiting_names = NameIndex(fuzzy_threshold, normalize=class_key)
+
+    def add_fragment(self, fragment: uml.UML):
+        if fragment is None:
+            return self
 
-                # perform merging
-                model_in_progress = result
-                continue
+        if self.model is None:
+            self.model = uml.UML(fragment.package_name)
+            self.index = ClassIndex(self.model, None, self.fuzzy_threshold)
 
-            # no match
-            model_in_progress.classes.append(incoming_class)
-            continue
+        # class fragment
+        if len(fragment.classes) == 1:
+            merge_class_fragment(self.index, fragment.classes[0])
+            self._release(fragment.classes[0].name)
+            return self
 
         # rel fragment
-        else:
-
-            if len(incoming_fragment.classes[0].associations) != 0:
-                incoming_rel = incoming_fragment.classes[0].associations[0]
-                rel_source_class_name = incoming_fragment.classes[0].name
-            else:
-                incoming_rel = incoming_fragment.classes[1].associations[0]
-                rel_source_class_name = incoming_fragment.classes[1].name
-
-            # check for existing classes
-
-            # perfect match
-            rel_dest_class_name = incoming_rel[0].name
-            existing_source_class_index = -1
-            existing_dest_class_index = -1
-
-            for index, existing_class in enumerate(model_in_progress.classes):
-                if existing_class.name == rel_source_class_name:
-                    existing_source_class_index = index
-                if existing_class.name == rel_dest_class_name:
-                    existing_dest_class_index = index
-
-            # one class does not exist
-            if existing_dest_class_index == -1 and existing_source_class_index != -1:
-                new_dest_class = uml.UMLClass(rel_dest_class_name, "class")
-                model_in_progress.classes[existing_source_class_index].association(
-                    new_dest_class, incoming_rel[1], incoming_rel[2]
+        missing = self._missing_classes(fragment)
+        if len(missing) == 0:
+            merge_rel_fragment(self.index, fragment)
+            return self
+
+        self.waiting_rels[id(fragment)] = fragment
+        for name in missing:
+            self._wait(name, fragment)
+        return self
+
+    def _missing_classes(self, fragment: uml.UML) -> list[str]:
+        source_name, dest_name, _ = rel_fragment_ends(fragment)
+        return [
+            name
+            for name in (source_name, dest_name)
+            if self.index.resolve(name) is None
+        ]
+
+    def _wait(self, name: str, fragment: uml.UML):
+        self._waiting_for.setdefault(class_key(name), []).append(fragment)
+        if self._waiting_names is not None:
+            self._waiting_names.add(name)
+
+    def _release(self, class_name: str):
+        """
+        Merges the waiting rels that were missing this class, by key or, with
+        a fuzzy threshold, by similar name
+        """
+        if self.index.resolve(class_name) is None:
+            return
+
+        keys = {class_key(class_name)}
+        if self._waiting_names is not None:
+            keys.update(
+                key
+                for _, key, _ in self._waiting_names.query(
+                    class_name, k=FUZZY_CANDIDATES
                 )
-                model_in_progress.classes.append(new_dest_class)
-                continue
+            )
 
-            elif existing_dest_class_index != -1 and existing_source_class_index == -1:
-                new_source_class = uml.UMLClass(rel_source_class_name, "class")
-                new_source_class.association(
-                    model_in_progress.classes[existing_dest_class_index],
-                    incoming_rel[1],
-                    incoming_rel[2],
-                )
-                model_in_progress.classes.append(new_source_class)
-                continue
+        for key in keys:
+            for fragment in self._waiting_for.pop(key, []):
+                if id(fragment) not in self.waiting_rels:
+                    continue
 
-            elif existing_source_class_index != -1 and existing_dest_class_index != -1:
-                # make a new rel between the two classes
-                model_in_progress.classes[existing_source_class_index].association(
-                    model_in_progress.classes[existing_dest_class_index],
-                    incoming_rel[1],
-                    incoming_rel[2],
-                )
-                continue
+                missing = self._missing_classes(fragment)
+                if len(missing) == 0:
+                    del self.waiting_rels[id(fragment)]
+                    merge_rel_fragment(self.index, fragment)
+                    continue
 
-            # SHOULD BE UNREACHABLE
-            # indirect match
+                # similar, but another class is closer to the missing name
+                for name in missing:
+                    if class_key(name) == key:
+                        self._waiting_for.setdefault(key, []).append(fragment)
 
-            result = indirect_matching_rel(model_in_progress, incoming_rel)
-            if result is not None:
-                model_in_progress = result
-                continue
+    def snapshot(self) -> uml.UML:
+        """
+        The model assembled so far. The assembler can keep receiving fragments.
+        """
+        if self.model is None:
+            return uml.UML("Nothing")
 
-            # no match
-            # TODO: Instantiate new classes and relationships
-            model_in_progress.classes.extend(incoming_fragment.classes)
+        index = self.index.copy()
+        for fragment in self.waiting_rels.values():
+            merge_rel_fragment(index, fragment.copy())
 
-            continue
+        return canonical_model(index)
+
+
+def rel_fragment_ends(fragment: uml.UML):
+    """
+    Returns (source class name, destination class name, association) of a rel fragment
+    """
+    if len(fragment.classes[0].associations) != 0:
+        incoming_rel = fragment.classes[0].associations[0]
+        rel_source_class_name = fragment.classes[0].name
+    else:
+        incoming_rel = fragment.classes[1].associations[0]
+        rel_source_class_name = fragment.classes[1].name
+
+    return rel_source_class_name, incoming_rel[0].name, incoming_rel
+
+
+def merge_class_fragment(index: ClassIndex, incoming_class: uml.UMLClass):
+    """
+    Merges the class of a class fragment into the indexed model
+    """
+    # check for existing similarities
+
+    # same identity
+    existing_class = index.resolve(incoming_class.name)
+    if existing_class is not None:
+
+        merge_attributes(incoming_class, existing_class)
+        index.index_attributes(existing_class, incoming_class.attributes)
+        return
+
+    # indirect match, adds the class when nothing is similar
+    indirect_matching_class(index.model, incoming_class, index)
+
+
+def merge_rel_fragment(index: ClassIndex, incoming_fragment: uml.UML):
+    """
+    Merges the relationship of a rel fragment into the indexed model
+    """
+    model_in_progress = index.model
+
+    rel_source_class_name, rel_dest_class_name, incoming_rel = rel_fragment_ends(
+        incoming_fragment
+    )
+
+    # check for existing classes
+
+    # perfect match
+    existing_source_class = index.resolve(rel_source_class_name)
+    existing_dest_class = index.resolve(rel_dest_class_name)
+
+    # one class does not exist
+    if existing_dest_class is None and existing_source_class is not None:
+        new_dest_class = uml.UMLClass(rel_dest_class_name, "class")
+        index.associate(
+            existing_source_class, new_dest_class, incoming_rel[1], incoming_rel[2]
+        )
+        index.append(new_dest_class)
+        return
+
+    elif existing_dest_class is not None and existing_source_class is None:
+        new_source_class = uml.UMLClass(rel_source_class_name, "class")
+        index.associate(
+            new_source_class,
+            existing_dest_class,
+            incoming_rel[1],
+            incoming_rel[2],
+        )
+        index.append(new_source_class)
+        return
+
+    elif existing_source_class is not None and existing_dest_class is not None:
+        # make a new rel between the two classes, or merge into the existing one
+        index.associate(
+            existing_source_class,
+            existing_dest_class,
+            incoming_rel[1],
+            incoming_rel[2],
+        )
+        return
+
+    # indirect match, neither class is in the model
+    indirect_matching_rel(model_in_progress, incoming_fragment, index)
+
+
+def merge(first: uml.UML, second: uml.UML) -> uml.UML:
+    """
+    Merges two assembled models into a new one, classes are matched by identity
+    (see class_key).
+
+    Same semantics as canonical_model: attributes are merged by name with
+    merge_attributes and relationships deduplicated per source, destination
+    and name. The merge is associative up to the order of classes, attributes
+    and relationships.
+    Neither input is modified.
+    """
+    combined = uml.UML(first.package_name)
+    combined.classes = first.copy().classes + second.copy().classes
+    return canonical_model(ClassIndex(combined))
+
+
+# fragments assembled sequentially by one worker before the tree reduction
+PARTITION_SIZE = 1000
+
+
+def assemble_tree(
+    fragments: list[uml.UML], max_workers: int = None, partition_size=PARTITION_SIZE
+):
+    """
+    Parallel assembly for very large fragment sets.
+
+    Fragments are ordered like assemble() orders them, split into partitions
+    that are assembled in a process pool, and the partial models are merged
+    pairwise, level by level, in the same pool.
+
+    Classes are only matched by identity across partitions, so the result
+    equals assemble() up to ordering when fragments do not rely on the
+    attribute to class matching of indirect_matching_class, whatever the
+    kind of the first fragment. See same_up_to_ordering().
+    """
+    fragments = [f for f in fragments if f is not None]
+    if len(fragments) == 0:
+        return uml.UML("Nothing")
+    package_name = fragments[0].package_name
+
+    # classes first, like assemble()
+    fragments = [f for f in fragments if f.classes[0].kind == "class"] + [
+        f for f in fragments if f.classes[0].kind != "class"
+    ]
+    partitions = [
+        fragments[start : start + partition_size]
+        for start in range(0, len(fragments), partition_size)
+    ]
+
+    if len(partitions) == 1:
+        assembled = assemble(partitions[0])
+        assembled.package_name = package_name
+        return assembled
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        level = list(executor.map(assemble, partitions))
+
+        while len(level) > 1:
+            merged = list(executor.map(merge, level[0::2], level[1::2]))
+            # odd one out goes to the next level as is
+            if len(level) % 2 == 1:
+                merged.append(level[-1])
+            level = merged
+
+    assembled = level[0]
+    assembled.package_name = package_name
+    return assembled
+
+
+def same_up_to_ordering(first: uml.UML, second: uml.UML) -> bool:
+    """
+    Whether two models have the same classes, attributes and relationships,
+    regardless of the order they are listed in
+    """
 
-    return remove_duplicates(model_in_progress)
+    def canonical(model: uml.UML):
+        return sorted(
+            (
+                uml_class.name,
+                sorted(uml_class.attributes, key=str),
+                sorted(
+                    ((rel[0].name, rel[1], rel[2]) for rel in uml_class.associations),
+                    key=str,
+                ),
+            )
+            for uml_class in model.classes
+        )
+
+    return canonical(first) == canonical(second)
 
 
 def merge_attributes(incoming_class, existing_class):
-    # Merge attributes
-    merged_attributes: list[Tuple[str, str]] = []
-    for incoming_attr in incoming_class.attributes:
-        existing_attr = None
-        for name, existing_type in existing_class.attributes:
-            if name == incoming_attr[0]:
-                existing_attr = (name, existing_attr)
-
-                # attribute not in existing class
-        if existing_attr is None:
-            merged_attributes.append(incoming_attr)
-
-            # attribute collision
-        else:
-            # if types collide, take the existing type
-            if existing_attr[1] != None:
-                merged_attributes.append(existing_attr)
-                # no type assigned to the existing attr, take the incoming type
-            else:
-                merged_attributes.append(incoming_attr)
-    return merged_attributes
+    """
+    Merges the incoming attributes into the existing class, in place.
 
+    An incoming attribute is added when the existing class has none of that
+    name. On a collision, the existing type is kept, unless the existing
+    attribute has no type. Lookups go through the attribute index of the
+    class, so merging costs O(incoming attributes).
 
-def indirect_matching_class(model: uml.UML, prospective_class: uml.UMLClass):
+    Returns the attributes of the existing class.
+    """
+    for name, incoming_type in incoming_class.attributes:
+        existing_class.merge_attribute(name, incoming_type)
+    return existing_class.attributes
+
+
+def indirect_matching_class(
+    model: uml.UML, prospective_class: uml.UMLClass, index: ClassIndex = None
+):
     """
     Checks for the most similar things in the model. If nothing, return None.
 
     Returns the merged model.
+
+    Pass the index of the model when there is one, otherwise it is built here.
     """
+    if index is None:
+        index = ClassIndex(model)
+
     # Case 0: The model contains an existing class whose name is very close to the
     # prospective class.
-    for existing_class in model.classes:
-
-        if existing_class.name.lower() == prospective_class.name.lower():
-            existing_class.attributes = merge_attributes(
-                prospective_class, existing_class
-            )
-            return model
+    existing_class = index.resolve(prospective_class.name)
+    if existing_class is not None:
+        merge_attributes(prospective_class, existing_class)
+        index.index_attributes(existing_class, prospective_class.attributes)
+        return model
 
     # Case 1: The model contains an attribute similar to the class.
     # Remove the attribute from the model and create a new relationship to the class
 
     # find all attributes that are identical to the prospective class
-    for existing_class in model.classes:
-        found_attribute = False
-
-        new_attributes = existing_class.attributes.copy()
-
-        for attribute in existing_class.attributes:
-            name, _ = attribute
-
-            # there is an identical attribute
-            if name.lower() == prospective_class.name.lower():
-                new_attributes.remove(attribute)
-                found_attribute = True
+    matching_keys = index.attribute_keys(prospective_class.name)
+    for existing_class in index.owners_of_attribute(
+        prospective_class.name, matching_keys
+    ):
 
         # this existing class contains an identical attribute
-        if found_attribute:
-            existing_class.attributes = new_attributes
+        existing_class.attributes = [
+            attribute
+            for attribute in existing_class.attributes
+            if class_key(attribute[0]) not in matching_keys
+        ]
 
-            association_name = prospective_class.name
-            association_name = association_name[0].lower() + association_name[1:]
+        association_name = prospective_class.name
+        association_name = association_name[0].lower() + association_name[1:]
 
-            # create new rel to the new class
-            existing_class.association(prospective_class, "", association_name)
+        # create new rel to the new class
+        index.associate(existing_class, prospective_class, "", association_name)
 
-    model.classes.append(prospective_class)
+    index.append(prospective_class)
 
     # Case 2: The model contains a relationship *identical* to the class.
     # Introduce the prospective class as a new class, leaving the rest untouched
@@ -213,80 +846,135 @@ def indirect_matching_class(model: uml.UML, prospective_class: uml.UMLClass):
     return model
 
 
-def indirect_matching_rel(model: uml.UML, prospective_rel: uml.UMLClass):
+def indirect_matching_rel(
+    model: uml.UML, prospective_rel: uml.UML, index: ClassIndex = None
+):
     """
-    Checks for the most similar things in the model with respect to the rel. If nothing, return None.
+    Checks for the most similar things in the model with respect to the rel
+    fragment, none of whose classes are in the model.
 
     Returns the merged model.
+
+    Pass the index of the model when there is one, otherwise it is built here.
     """
-    # TODO
-    # Do nothing for now
-    return None
+    if index is None:
+        index = ClassIndex(model)
+
+    source_name, dest_name, incoming_rel = rel_fragment_ends(prospective_rel)
+
+    # The classes of the rel are introduced like class fragments, an attribute
+    # of the model named like one of them becomes a relationship to it
+    for name in (source_name, dest_name):
+        if index.lookup(name) is None:
+            indirect_matching_class(model, uml.UMLClass(name, "class"), index)
+
+    # the relationship itself, merged with an identical existing one
+    index.associate(
+        index.lookup(source_name),
+        index.lookup(dest_name),
+        incoming_rel[1],
+        incoming_rel[2],
+    )
+    return model
 
 
 def remove_duplicates(model: uml.UML):
     """
     Removes the duplicated classes and relationships
+
+    Classes are duplicates when they have the same name. Relationships are
+    duplicates when they have the same source, destination and name.
+    Linear in the number of classes and associations.
     """
     new_model = uml.UML(model.package_name)
 
     new_classes: dict[str, uml.UMLClass] = {}  # name, uml
-    # name (source dest), list[tuple] (tuple[0] = name, tuple[1] = mult)
-    new_relationships = {}
+    known_attributes: dict[str, set] = {}  # name, attributes of the new class
+    # (source name, dest name, rel name) -> association
+    new_relationships: dict[Tuple[str, str, str], AssociationRecord] = {}
+
+    def class_of(name: str) -> str:
+        # classes only met as a destination are created too
+        if name not in new_classes:
+            new_classes[name] = uml.UMLClass(name, "class")
+            known_attributes[name] = set()
+        return name
 
     for uml_class in model.classes:
 
         if not uml_class.name in new_classes:
             new_classes[uml_class.name] = uml.UMLClass(uml_class.name, "class")
-            new_classes[uml_class.name].attributes = uml_class.attributes
+            new_classes[uml_class.name].attributes = list(uml_class.attributes)
+            known_attributes[uml_class.name] = set(uml_class.attributes)
 
         else:
             # merge attributes
+            seen = known_attributes[uml_class.name]
             for attribute in uml_class.attributes:
 
-                if attribute not in new_classes[uml_class.name].attributes:
+                if attribute not in seen:
+                    seen.add(attribute)
                     new_classes[uml_class.name].attribute(attribute[0], attribute[1])
 
-        # relationships
-        get_unique_relationships(new_relationships, uml_class)
+    # relationships
+    for uml_class in model.classes:
+        get_unique_relationships(new_relationships, uml_class, class_of)
 
     # link all the relationships
-    for name, relation in new_relationships.items():
-        source_name, dest_name = name.split()
-
-        for relation_tuple in relation:
-            new_classes[source_name].association(
-                new_classes[dest_name], relation_tuple[1], relation_tuple[0]
-            )
+    for relation in new_relationships.values():
+        new_classes[relation.source].association(
+            new_classes[relation.destination], relation.multiplicity, relation.name
+        )
 
     new_model.classes = list(new_classes.values())
     return new_model
 
 
-def get_unique_relationships(new_relationships, uml_class: uml.UMLClass):
-    for relation in uml_class.associations:
-        relation_hash = f"{uml_class.name} {relation[0].name}"
+class AssociationRecord:
+    """
+    An association while relationships are deduplicated, its multiplicity can
+    still be merged
+    """
 
-        if relation_hash in new_relationships:
-            # look for names
-            has_existing_name = False
-            for rel in new_relationships[relation_hash]:
-                if rel[0] == relation[2]:
-                    has_existing_name = True
+    __slots__ = ("source", "destination", "multiplicity", "name")
 
-                    # if an existing relationship of the same name, merge multiplicity
-                    if rel[1] == "" and relation[1] != "":
-                        # multiplicity takes over no multiplicity
-                        rel[1] = relation[1]
-                    else:
-                        # precedence is given to existing multiplicity in the case of conflicting non-null mults
-                        pass
-                    break
+    def __init__(self, source: str, destination: str, multiplicity: str, name: str):
+        self.source = source
+        self.destination = destination
+        self.multiplicity = multiplicity
+        self.name = name
 
-                # no existing name found, create a new one
-            if not has_existing_name:
-                new_relationships[relation_hash].append((relation[2], relation[1]))
 
-        else:
-            # create the hash for the source-dest case
-            new_relationships[relation_hash] = [(relation[2], relation[1])]
+def get_unique_relationships(
+    new_relationships: dict[Tuple[str, str, str], AssociationRecord],
+    uml_class: uml.UMLClass,
+    class_key=None,
+):
+    """
+    Adds the associations of a class to new_relationships, merging the ones
+    with the same source, destination and name.
+
+    class_key maps a class name to the key classes are told apart by, the
+    name itself by default.
+    """
+    if class_key is None:
+        class_key = lambda name: name
+
+    source = class_key(uml_class.name)
+
+    for destination, multiplicity, name in uml_class.associations:
+        relation_key = (source, class_key(destination.name), name)
+        existing = new_relationships.get(relation_key)
+
+        if existing is None:
+            new_relationships[relation_key] = AssociationRecord(
+                relation_key[0], relation_key[1], multiplicity, name
+            )
+
+        # if an existing relationship of the same name, merge multiplicity
+        elif existing.multiplicity == "" and multiplicity != "":
+            # multiplicity takes over no multiplicity
+            existing.multiplicity = multiplicity
+
+        # precedence is given to existing multiplicity in the case of conflicting
+        # non-null mults
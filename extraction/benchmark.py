@@ -0,0 +1,393 @@
+"""
+Benchmarks for the assembly on large synthetic models
+
+Usage: python -m extraction.benchmark [benchmark name ...]
+
+Without a name, every benchmark runs. The synthetic data does not depend on
+the dataset, so the benchmarks run anywhere.
+"""
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+from .utils import columnar, fuzzy, metrics, render, uml
+from . import assemble
+
+# fragment counts of the scaling curves
+SCALING_SIZES = (10, 100, 1_000, 10_000, 100_000)
+
+# a curve stops before a size projected to take longer than this, in seconds
+TIME_BUDGET = 30.0
+
+
+def synthetic_model(
+    class_count: int,
+    duplicate_ratio: float = 0.3,
+    attributes_per_class: int = 3,
+    associations_per_class: int = 3,
+    seed: int = 0,
+) -> uml.UML:
+    """
+    A model where a share of the classes are duplicates of each other by
+    name, with attributes and associations that repeat across duplicates
+    """
+    generator = random.Random(seed)
+    distinct_names = max(1, int(class_count * (1 - duplicate_ratio)))
+
+    model = uml.UML("Synthetic")
+    for _ in range(class_count):
+        model.classes.append(
+            uml.UMLClass(f"Class{generator.randrange(distinct_names)}", "class")
+        )
+
+    for uml_class in model.classes:
+        for _ in range(attributes_per_class):
+            uml_class.attribute(
+                f"attribute{generator.randrange(attributes_per_class * 2)}",
+                generator.choice([None, "int", "str"]),
+            )
+        for _ in range(associations_per_class):
+            uml_class.association(
+                generator.choice(model.classes),
+                generator.choice(["", "1..1", "0..*"]),
+                generator.choice(["", "has", "owns"]),
+            )
+
+    return model
+
+
+def synthetic_fragments(
+    fragment_count: int,
+    name_collisions: float = 0.3,
+    attributes_per_class: int = 3,
+    relation_density: float = 1.5,
+    seed: int = 0,
+    name_variants: bool = True,
+):
+    """
+    Class and rel fragments shaped like the ones of the extraction, with the
+    model they come from.
+
+    name_collisions is the share of class fragments naming a class that
+    already has a fragment. Names are a case or plural variant of the class
+    name half of the time, unless name_variants is False. relation_density
+    is the number of rel fragments per class fragment.
+
+    Returns (fragments, ground truth model), fragments in a random order
+    """
+    generator = random.Random(seed)
+    class_count = max(1, round(fragment_count / (1 + relation_density)))
+    rel_count = fragment_count - class_count
+    distinct_names = max(1, round(class_count * (1 - name_collisions)))
+
+    def variant(name: str) -> str:
+        if not name_variants or generator.random() < 0.5:
+            return name
+        return generator.choice([name.lower(), name + "s", name.upper()])
+
+    ground_classes: dict[str, uml.UMLClass] = {}
+    fragments = []
+
+    for position in range(class_count):
+        if position < distinct_names:
+            name = f"Class{position}"
+            ground_classes[name] = uml.UMLClass(name, "class")
+        else:
+            name = f"Class{generator.randrange(distinct_names)}"
+        ground_class = ground_classes[name]
+
+        uml_class = uml.UMLClass(variant(name), "class")
+        for _ in range(generator.randint(0, attributes_per_class * 2)):
+            attribute_name = f"attribute{generator.randrange(attributes_per_class * 4)}"
+            attribute_type = generator.choice(["int", "str", "bool"])
+            uml_class.attribute(attribute_name, attribute_type)
+            ground_class.merge_attribute(attribute_name, attribute_type)
+
+        fragment = uml.UML(uml_class.name)
+        fragment.classes = [uml_class]
+        fragments.append(fragment)
+
+    ground_relationships = set()
+    for _ in range(rel_count):
+        source_name = f"Class{generator.randrange(distinct_names)}"
+        dest_name = f"Class{generator.randrange(distinct_names)}"
+        multiplicity = generator.choice(["", "1..1", "0..*", "1..*"])
+        name = generator.choice(["has", "owns", "uses", "contains"])
+
+        source = uml.UMLClass(variant(source_name), "rel")
+        dest = uml.UMLClass(variant(dest_name), "rel")
+        source.association(dest, multiplicity, name)
+        fragment = uml.UML(source.name)
+        fragment.classes = [source, dest]
+        fragments.append(fragment)
+
+        if (source_name, dest_name, name) not in ground_relationships:
+            ground_relationships.add((source_name, dest_name, name))
+            ground_classes[source_name].association(
+                ground_classes[dest_name], multiplicity, name
+            )
+
+    generator.shuffle(fragments)
+
+    ground_truth = uml.UML("Synthetic")
+    ground_truth.classes = list(ground_classes.values())
+    return fragments, ground_truth
+
+
+def best_time(function, *args, repeat: int = 3, setup=None) -> float:
+    """
+    Best wall time of a few calls, in seconds.
+
+    setup, when given, makes the arguments of every call outside of the
+    timing, for functions that change their arguments.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            args = setup()
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def growth_exponent(first, second) -> float:
+    """
+    Exponent of the growth between two (size, seconds) timings, 1 is linear
+    """
+    return math.log(second[1] / first[1]) / math.log(second[0] / first[0])
+
+
+def projected_time(timings: list, size: int) -> float:
+    """
+    Time of a size from the last timings, assuming at least linear growth
+    """
+    if len(timings) == 0:
+        return 0.0
+
+    exponent = 1.0
+    if len(timings) > 1 and timings[-2][1] > 0 and timings[-1][1] > 0:
+        exponent = max(exponent, growth_exponent(timings[-2], timings[-1]))
+    last_size, last_seconds = timings[-1]
+    return last_seconds * (size / last_size) ** exponent
+
+
+def print_scaling(title: str, timings: list):
+    """
+    Prints (size, seconds) timings with the growth exponent between two
+    sizes: 1 is linear, 2 quadratic
+    """
+    print(title)
+    print(f"{'fragments':>10} {'seconds':>10} {'us/fragment':>12} {'exponent':>9}")
+
+    previous = None
+    for size, seconds in timings:
+        exponent = ""
+        if previous is not None and previous[1] > 0 and seconds > 0:
+            exponent = f"{growth_exponent(previous, (size, seconds)):.2f}"
+        print(
+            f"{size:>10} {seconds:>10.4f} {seconds / size * 1e6:>12.3f}"
+            f" {exponent:>9}"
+        )
+        previous = (size, seconds)
+
+
+def benchmark_remove_duplicates(sizes=(1_000, 10_000, 100_000)):
+    print("remove_duplicates")
+    print(f"{'classes':>10} {'associations':>13} {'seconds':>10} {'us/element':>11}")
+
+    for size in sizes:
+        model = synthetic_model(size)
+        elements = size + sum(len(c.associations) for c in model.classes)
+        seconds = best_time(assemble.remove_duplicates, model)
+        print(
+            f"{size:>10} {elements - size:>13} {seconds:>10.4f}"
+            f" {seconds / elements * 1e6:>11.3f}"
+        )
+
+
+def benchmark_merge_attributes(sizes=(10, 100, 1_000), merges: int = 1_000):
+    print("merge_attributes")
+    print(f"{'attributes':>10} {'merges':>7} {'seconds':>10} {'us/attribute':>13}")
+
+    for size in sizes:
+        # half of the incoming attributes collide with existing ones
+        existing_class = uml.UMLClass("Existing", "class")
+        incoming_class = uml.UMLClass("Incoming", "class")
+        for position in range(size):
+            existing_class.attribute(f"attribute{position}", None)
+            incoming_class.attribute(f"attribute{position + size // 2}", "int")
+
+        def existing_classes():
+            # merging changes the existing class, every merge gets its own
+            copies = []
+            for _ in range(merges):
+                copy = uml.UMLClass("Existing", "class")
+                copy.attributes = existing_class.attributes
+                copies.append(copy)
+            return (copies,)
+
+        def merge_all(copies):
+            for copy in copies:
+                assemble.merge_attributes(incoming_class, copy)
+
+        seconds = best_time(merge_all, setup=existing_classes)
+        print(
+            f"{size:>10} {merges:>7} {seconds:>10.4f}"
+            f" {seconds / (merges * size) * 1e6:>13.3f}"
+        )
+
+
+def benchmark_name_index(sizes=(1_000, 10_000, 100_000), queries: int = 200):
+    print("fuzzy.NameIndex, top 1 query against a scan of every name")
+    print(f"{'names':>10} {'build s':>10} {'query us':>10} {'scan us':>10}")
+
+    generator = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    names = [
+        "".join(generator.choice(letters) for _ in range(generator.randint(5, 12)))
+        for _ in range(max(sizes))
+    ]
+    # misspelled names of the index
+    misspelled = [name[:-1] + "x" for name in names[:queries]]
+
+    for size in sizes:
+        start = time.perf_counter()
+        index = fuzzy.NameIndex(0.6)
+        for name in names[:size]:
+            index.add(name)
+        build = time.perf_counter() - start
+
+        def query_all():
+            for name in misspelled:
+                index.query(name)
+
+        def scan_some():
+            for name in misspelled[:10]:
+                grams = fuzzy.ngrams(name)
+                max(fuzzy.jaccard(grams, other) for other in index.grams.values())
+
+        query = best_time(query_all) / len(misspelled)
+        scan = best_time(scan_some, repeat=1) / 10
+        print(f"{size:>10} {build:>10.2f} {query * 1e6:>10.1f} {scan * 1e6:>10.1f}")
+
+
+def benchmark_assembly(sizes=SCALING_SIZES, time_budget: float = TIME_BUDGET, **shape):
+    """
+    Scaling curves of assemble, remove_duplicates and compute_metrics, object
+    and columnar, on synthetic fragments, see synthetic_fragments for the shape arguments.
+
+    A curve stops before the first size projected to take longer than the
+    time budget, quadratic parts would take hours at 100k fragments.
+    """
+    curves = {
+        "assemble": [],
+        "remove_duplicates": [],
+        "compute_metrics": [],
+        "columnar.compute_metrics": [],
+    }
+
+    for size in sizes:
+        fragments, ground_truth = synthetic_fragments(size, **shape)
+        repeat = 3 if size <= 10_000 else 1
+
+        def copied_fragments():
+            return ([fragment.copy() for fragment in fragments],)
+
+        def raw_model():
+            # every fragment in one model, what assemble starts from
+            model = uml.UML("Synthetic")
+            for fragment in copied_fragments()[0]:
+                model.classes.extend(fragment.classes)
+            return (model,)
+
+        def assembled_model():
+            return ([assemble.assemble(copied_fragments()[0])], [ground_truth])
+
+        calls = {
+            "assemble": (assemble.assemble, copied_fragments),
+            "remove_duplicates": (assemble.remove_duplicates, raw_model),
+            "compute_metrics": (metrics.compute_metrics, assembled_model),
+            "columnar.compute_metrics": (columnar.compute_metrics, assembled_model),
+        }
+
+        for name, (function, setup) in calls.items():
+            timings = curves[name]
+            if projected_time(timings, size) > time_budget:
+                continue
+            timings.append((size, best_time(function, repeat=repeat, setup=setup)))
+
+    for name, timings in curves.items():
+        print_scaling(name, timings)
+        if timings[-1][0] != sizes[-1]:
+            print(
+                f"stopped after {timings[-1][0]} fragments,"
+                f" the next size is projected over {time_budget}s"
+            )
+        print()
+
+
+def benchmark_rendering(sizes=(10, 100, 1_000), single_runs: int = 5):
+    """
+    Throughput of one PlantUML process for every diagram, against one java
+    per diagram like render.sh, timed on a few diagrams only.
+
+    Needs java and the jar of PLANTUML_JAR, skipped without them.
+    """
+    print("rendering, PlantUML diagrams per second")
+    if render.PLANTUML_JAR is None or not os.path.isfile(render.PLANTUML_JAR):
+        print(f"skipped, no PlantUML jar at {render.PLANTUML_JAR}, set PLANTUML_JAR")
+        return
+
+    fragments, _ = synthetic_fragments(max(sizes))
+    diagrams = [fragment.to_string() for fragment in fragments]
+
+    def render_one_per_java():
+        for diagram in diagrams[:single_runs]:
+            subprocess.run(
+                [render.JAVA, "-jar", render.PLANTUML_JAR, "-pipe", "-tpng"],
+                input=diagram.encode(),
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+
+    single = best_time(render_one_per_java, repeat=1) / single_runs
+    print(f"{'one java per diagram':>24} {1 / single:>10.1f}")
+
+    print(f"{'diagrams':>10} {'seconds':>10} {'diagrams/s':>11} {'speedup':>8}")
+    with render.PlantUMLRenderer() as renderer:
+        # JVM startup and warm up
+        renderer.render(diagrams[0])
+        for size in sizes:
+            seconds = best_time(renderer.render_many, diagrams[:size], repeat=1)
+            print(
+                f"{size:>10} {seconds:>10.3f} {size / seconds:>11.1f}"
+                f" {single * size / seconds:>8.1f}"
+            )
+
+
+BENCHMARKS = {
+    "assembly": benchmark_assembly,
+    "remove_duplicates": benchmark_remove_duplicates,
+    "merge_attributes": benchmark_merge_attributes,
+    "name_index": benchmark_name_index,
+    "rendering": benchmark_rendering,
+}
+
+
+if __name__ == "__main__":
+    selected = sys.argv[1:] if len(sys.argv) > 1 else list(BENCHMARKS)
+    for benchmark_name in selected:
+        if benchmark_name not in BENCHMARKS:
+            raise Exception(
+                "Unknown benchmark {}, one of {}".format(
+                    benchmark_name, ", ".join(BENCHMARKS)
+                )
+            )
+
+    for benchmark_name in selected:
+        BENCHMARKS[benchmark_name]()
+        print()
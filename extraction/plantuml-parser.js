@@ -7,35 +7,56 @@ import * as path from 'path';
 
 if (argv.length == 2) {
   console.log("This script turns the plantuml into a json.")
-  console.log("Usage: node plantuml-parser.js plantuml-file")
+  console.log("Usage: node plantuml-parser.js plantuml-file-or-folder [more files or folders...]")
+  console.log("Every .plantuml file of a folder is converted.")
   exit()
 }
 
-// read plantuml file
-fs.readFile(argv[2], 'utf8', function (err, data) {
-  if (err) throw err;
+// gather the files to convert, folders are expanded to their .plantuml files
+function collectInputs(args) {
+  const inputs = []
+  for (const arg of args) {
+    if (fs.existsSync(arg) && fs.statSync(arg).isDirectory()) {
+      for (const entry of fs.readdirSync(arg)) {
+        if (entry.endsWith(".plantuml")) {
+          inputs.push(path.join(arg, entry))
+        }
+      }
+    } else {
+      inputs.push(arg)
+    }
+  }
+  return inputs
+}
 
-  // console.log(data)
+// converts one file, the json is written next to it
+async function convert(source) {
+  const data = await fs.promises.readFile(source, 'utf8')
 
   // parse PlantUML
   const result = parse(data);
 
-  // // Format and print parse result
-  // console.log(
-  //   formatters.default(result)
-  // );
-
   // write file
-  const parsed_source = path.parse(argv[2])
+  const parsed_source = path.parse(source)
   const destination = path.join(parsed_source.dir, parsed_source.name + ".json")
 
   // only write the first result
-  fs.writeFile(destination, JSON.stringify(result[0], null, 2), err => {
-    if (err) {
-      console.error(err)
-      return
-    }
-    //file written successfully
-    console.log("File written to: " + destination)
-  })
-});
\ No newline at end of file
+  await fs.promises.writeFile(destination, JSON.stringify(result[0], null, 2))
+  //file written successfully
+  console.log("File written to: " + destination)
+}
+
+// one node process for every file, failures do not stop the batch
+let failures = 0
+for (const source of collectInputs(argv.slice(2))) {
+  try {
+    await convert(source)
+  } catch (err) {
+    failures += 1
+    console.error("Could not convert " + source + ": " + err.message)
+  }
+}
+
+if (failures != 0) {
+  exit(1)
+}
@@ -1,32 +1,30 @@
+import json
 import pickle
 import re
 import shutil
-import subprocess
-from .utils import inquire, uml
-from . import assemble
+from .utils import archive, inquire, uml
+from . import assemble, benchmark
 from .parse import LazyLoadedExtractor
 
 import os, pandas
 
 # Initialize the test suite
 CURRENT_SCRIPT_DIR = os.path.abspath(os.path.dirname(__file__))
-ZOO_DIR = "C:\\Users\\songy\\Documents\\My Documents\\UDEM\\master thesis\\uml data\\database\\analysis\\zoo\\"
-SOURCE_DIR = "C:\\Users\\songy\\Documents\\My Documents\\UDEM\\master thesis\\uml data\\database\\analysis\\"
 
 TEMP_FOLDER = os.path.join(CURRENT_SCRIPT_DIR, "temp")
 os.makedirs(TEMP_FOLDER, exist_ok=True)
 
-LABELS = pandas.read_csv(os.path.join(SOURCE_DIR, "labels.csv"))
-FRAGMENTS = pandas.read_csv(os.path.join(SOURCE_DIR, "fragments.csv"))
+# fragments of the nlp pipeline, grouped by model, see utils.archive
+FRAGMENTS_ARCHIVE = os.path.join(TEMP_FOLDER, "fragments.jsonl")
+PREPROCESSED_FRAGMENTS_ARCHIVE = os.path.join(
+    TEMP_FOLDER, "fragments_preprocessed.jsonl"
+)
 
+# fragments pickled one per file by earlier versions, migrated to the archives
 PICKLED_DIR = os.path.join(TEMP_FOLDER, "pickled")
-os.makedirs(PICKLED_DIR, exist_ok=True)
 PREPROCESSED_PICKLED_DIR = os.path.join(PICKLED_DIR, "preprocessed")
-os.makedirs(PREPROCESSED_PICKLED_DIR, exist_ok=True)
 
-PLANTUML_PARSER = os.path.join(
-    SOURCE_DIR, "three-step", "extraction", "plantuml-parser.js"
-)
+PLANTUML_PARSER = inquire.PLANTUML_PARSER
 
 
 def test_assembly_ground_truth(selective: str = ""):
@@ -42,24 +40,26 @@ def test_assembly_ground_truth(selective: str = ""):
     models: dict[str, uml.UML] = {}
     grouped: dict[str, list[uml.UML]] = {}
 
-    for index, row in LABELS.iterrows():
+    for label_id in inquire.DATASET.label_ids():
 
-        fragment = FRAGMENTS.loc[FRAGMENTS["unique_id"] == row["fragment_id"]]
+        fragment = inquire.DATASET.label_fragment(label_id)
 
         # get the model's uml
-        model_name = fragment["model"].values[0]
+        model_name = fragment.model
 
         # selective runs
         if selective != "" and model_name != selective:
             continue
 
-        model = inquire.get_json_uml(os.path.join(ZOO_DIR, model_name + ".json"))
-        models[model_name] = model
+        if model_name not in models:
+            model = inquire.get_json_uml(
+                os.path.join(inquire.DATASET.zoo_dir, model_name + ".json")
+            )
+            models[model_name] = model
 
         # get the fragment's uml
-        label_id: str = row["id"]
         # WATCH OUT FOR ECORE OR JSON
-        fragment_uml = inquire.get_json_uml_fragment(int(label_id))
+        fragment_uml = inquire.get_json_uml_int(int(label_id))
         if model_name in grouped:
             grouped[model_name].append(fragment_uml)
         else:
@@ -151,7 +151,7 @@ def run_nlp_pipeline():
     Save results to disk
     """
     classified_fragments_path = os.path.join(
-        SOURCE_DIR, "three-step", "data", "fragment_kinds.csv"
+        inquire.SOURCE_DIR, "three-step", "data", "fragment_kinds.csv"
     )
     classified_fragments = pandas.read_csv(
         classified_fragments_path, header=0, index_col=0
@@ -160,31 +160,28 @@ def run_nlp_pipeline():
     class_extractor = LazyLoadedExtractor("", "class")
     rel_extractor = LazyLoadedExtractor("", "rel")
 
-    for index, row in classified_fragments.iterrows():
-        if row["kind"] == "class":
-            class_extractor.extractor.set_sentence(row["english"])
-            result = class_extractor.handle_class(verbose=False)
-        elif row["kind"] == "rel":
-            rel_extractor.extractor.set_sentence(row["english"])
-            result = rel_extractor.handle_rel(verbose=False)
-        else:
-            raise Exception("Unexpected kind!")
+    with archive.ArchiveWriter(FRAGMENTS_ARCHIVE) as fragments:
+        for index, row in classified_fragments.iterrows():
+            if row["kind"] == "class":
+                class_extractor.extractor.set_sentence(row["english"])
+                result = class_extractor.handle_class(verbose=False)
+            elif row["kind"] == "rel":
+                rel_extractor.extractor.set_sentence(row["english"])
+                result = rel_extractor.handle_rel(verbose=False)
+            else:
+                raise Exception("Unexpected kind!")
 
-        if result is not None:
-            # get the name of this fragment
-            ground_truth_fragment_name = inquire.get_uml_fragment_name(index)
-            # pickle the uml under this name
-            with open(
-                os.path.join(PICKLED_DIR, ground_truth_fragment_name), "wb+"
-            ) as pickled_file:
-                pickle.dump(result, pickled_file)
+            if result is not None:
+                # save the uml under the name of the ground truth fragment
+                fragment = inquire.DATASET.label_fragment(index)
+                fragments.add(fragment.name, result, fragment.model)
 
 
 def run_nlp_pipeline_preprocessed():
     from preprocess import resolve_coref, LazyLoadedClassifier
 
     classified_fragments_path = os.path.join(
-        SOURCE_DIR, "three-step", "data", "grouped.csv"
+        inquire.SOURCE_DIR, "three-step", "data", "grouped.csv"
     )
     classified_fragments = pandas.read_csv(
         classified_fragments_path, header=0, index_col=0
@@ -194,58 +191,57 @@ def run_nlp_pipeline_preprocessed():
     rel_extractor = LazyLoadedExtractor("", "rel")
     classifier = LazyLoadedClassifier()
 
-    for row_index, row in classified_fragments.iterrows():
-        model_name = row["model"]
+    with archive.ArchiveWriter(PREPROCESSED_FRAGMENTS_ARCHIVE) as fragments:
+        for row_index, row in classified_fragments.iterrows():
+            model_name = row["model"]
 
-        # call preprocessor
-        split_sentences = resolve_coref(row["text"])
+            # call preprocessor
+            split_sentences = resolve_coref(row["text"])
 
-        for index, sentence in split_sentences.items():
+            for index, sentence in split_sentences.items():
 
-            # call classifier
-            kind = classifier.predict(text=sentence)
-            if kind == "class":
-                class_extractor.extractor.set_sentence(sentence)
-                result = class_extractor.handle_class(verbose=False)
-            elif kind == "rel":
-                rel_extractor.extractor.set_sentence(sentence)
-                result = rel_extractor.handle_rel(verbose=False)
-            else:
-                raise Exception("Unexpected kind!")
+                # call classifier
+                kind = classifier.predict(text=sentence)
+                if kind == "class":
+                    class_extractor.extractor.set_sentence(sentence)
+                    result = class_extractor.handle_class(verbose=False)
+                elif kind == "rel":
+                    rel_extractor.extractor.set_sentence(sentence)
+                    result = rel_extractor.handle_rel(verbose=False)
+                else:
+                    raise Exception("Unexpected kind!")
 
-            # save the result to disk
-            if result is not None:
-                # get the name of this fragment
-                ground_truth_fragment_name = f"{model_name}_{kind}{index}"
-                # pickle the uml under this name
-                with open(
-                    os.path.join(PREPROCESSED_PICKLED_DIR, ground_truth_fragment_name),
-                    "wb+",
-                ) as pickled_file:
-                    pickle.dump(result, pickled_file)
+                # save the result to disk
+                if result is not None:
+                    fragments.add(f"{model_name}_{kind}{index}", result, model_name)
 
 
-def test_assembly(used_preprocessed: bool = False):
+def test_assembly(used_preprocessed: bool = False, native_parser: bool = True):
     """
     Tests the assembly on the fragments generated by the pipeline.
 
     Two choices. Raw fragments or preprocessed fragments.
+
+    The ground truth is read from the zoo plantuml in process, unless
+    native_parser is False, in which case the node parser's json is used.
     """
 
     # Use the NLP pipeline and save intermediary results to disk
 
     # Read raw fragments from the fragment_kinds.csv
     if not used_preprocessed:
-        if len(os.listdir(PICKLED_DIR)) == 0:
+        migrate_pickles(PICKLED_DIR, FRAGMENTS_ARCHIVE)
+        if not os.path.exists(FRAGMENTS_ARCHIVE):
             run_nlp_pipeline()
 
-        grouped = read_pickles(PICKLED_DIR)
+        grouped = read_archive(FRAGMENTS_ARCHIVE)
 
     # Read preprocessed fragments from the split.csv
     else:
-        if len(os.listdir(PREPROCESSED_PICKLED_DIR)) == 0:
+        migrate_pickles(PREPROCESSED_PICKLED_DIR, PREPROCESSED_FRAGMENTS_ARCHIVE)
+        if not os.path.exists(PREPROCESSED_FRAGMENTS_ARCHIVE):
             run_nlp_pipeline_preprocessed()
-        grouped = read_pickles(PREPROCESSED_PICKLED_DIR)
+        grouped = read_archive(PREPROCESSED_FRAGMENTS_ARCHIVE)
 
     results = {}
 
@@ -262,24 +258,16 @@ def test_assembly(used_preprocessed: bool = False):
     failed_predictions: list[uml.UML] = []
     failed_models: list[uml.UML] = []
 
+    if not native_parser:
+        # parse every missing ground truth in one node process
+        zoo_dir = inquire.DATASET.zoo_dir
+        inquire.convert_missing_json(
+            [os.path.join(zoo_dir, name + ".plantuml") for name in results]
+        )
+
     # Compare the assembled result with ground truth, version "zoo plantuml"
-    # This depends on the plantuml parser
     for model_name, assembled in results.items():
-        json_file = os.path.join(ZOO_DIR, model_name + ".json")
-        if not os.path.isfile(json_file):
-            # parse the plantuml with the node package
-            exit_code = subprocess.call(
-                args=[
-                    "node",
-                    PLANTUML_PARSER,
-                    json_file.removesuffix(".json") + ".plantuml",
-                ]
-            )
-
-            if exit_code != 0:
-                raise Warning("Did not generate json properly: {}", json_file)
-
-        ground_truth = inquire.get_json_uml(json_file)
+        ground_truth = get_ground_truth(model_name, native_parser)
 
         if assembled == ground_truth:
             # correct
@@ -321,38 +309,85 @@ def test_assembly(used_preprocessed: bool = False):
     failed_dataframe.to_csv(os.path.join(TEMP_FOLDER, "assembly_failed.csv"))
 
 
-def read_pickles(location: str):
+def read_archive(path: str):
+    """
+    The fragments of an archive grouped by model
+    """
     grouped = {}  # model name, list of fragments
 
-    for pickled_path in os.listdir(location):
-        potential_file = os.path.join(location, pickled_path)
-        if not os.path.isfile(potential_file):
-            continue
-        with open(potential_file, "rb") as pickled_file:
-            pickled: uml.UML = pickle.load(pickled_file)
+    with archive.ArchiveReader(path) as fragments:
+        for _, model_name, fragment in fragments:
+            if model_name in grouped:
+                grouped[model_name].append(fragment)
+            else:
+                grouped[model_name] = [fragment]
+    return grouped
 
-        model_name = re.split("_(class|rel)\d+", pickled_path)[0]
 
-        if model_name in grouped:
-            grouped[model_name].append(pickled)
-        else:
-            grouped[model_name] = [pickled]
-    return grouped
+def migrate_pickles(location: str, path: str):
+    """
+    Moves the fragments pickled one per file by earlier versions into an
+    archive, when there is no archive yet
+    """
+    if os.path.exists(path) or not os.path.isdir(location):
+        return
+
+    pickled_paths = [
+        pickled_path
+        for pickled_path in sorted(os.listdir(location))
+        if os.path.isfile(os.path.join(location, pickled_path))
+    ]
+    if len(pickled_paths) == 0:
+        return
+
+    with archive.ArchiveWriter(path) as fragments:
+        for pickled_path in pickled_paths:
+            with open(os.path.join(location, pickled_path), "rb") as pickled_file:
+                pickled: uml.UML = pickle.load(pickled_file)
+
+            model_name = re.split(r"_(class|rel)\d+", pickled_path)[0]
+            fragments.add(pickled_path, pickled, model_name)
+
+
+def get_ground_truth(model_name: str, native_parser: bool = True):
+    """
+    Reads the zoo plantuml of a model, from the packed zoo when there is one
+    """
+    extension = ".plantuml" if native_parser else ".json"
+    model = inquire.DATASET.zoo_model(model_name + extension)
+    if model is not None:
+        return model
+
+    plantuml_file = os.path.join(inquire.DATASET.zoo_dir, model_name + ".plantuml")
+    if native_parser:
+        return inquire.get_plantuml_uml(plantuml_file)
+
+    # This depends on the plantuml parser
+    inquire.convert_missing_json([plantuml_file])
 
+    return inquire.get_json_uml(plantuml_file.removesuffix(".plantuml") + ".json")
 
-def test_assembly_ground_truth_plantuml(selective: str = ""):
+
+def test_assembly_ground_truth_plantuml(
+    selective: str = "", native_parser: bool = True
+):
     """
     Tests the program on the ground truth but with the new plantuml fragmentation
     """
     fragments_folder = os.path.join(
-        SOURCE_DIR, "three-step", "data", "fragmented_again"
+        inquire.SOURCE_DIR, "three-step", "data", "fragmented_again"
     )
     grouped = pandas.read_csv(
-        os.path.join(SOURCE_DIR, "three-step", "data", "grouped.csv")
+        os.path.join(inquire.SOURCE_DIR, "three-step", "data", "grouped.csv")
     )
 
     results = {}
 
+    fragment_files = [
+        f for f in os.listdir(fragments_folder) if f.endswith(".plantuml")
+    ]
+    grouped_fragments: dict[str, list[str]] = {}
+
     for index, row in grouped.iterrows():
         model_name = row["model"]
 
@@ -362,26 +397,28 @@ def test_assembly_ground_truth_plantuml(selective: str = ""):
         if selective != "" and model_name != selective:
             continue
 
-        fragments = [
+        grouped_fragments[model_name] = [
             os.path.join(fragments_folder, f)
-            for f in os.listdir(fragments_folder)
-            if f.startswith(model_name) and f.endswith(".plantuml")
+            for f in fragment_files
+            if f.startswith(model_name)
         ]
 
-        # create json if it doesn't exist
-        for fragment in fragments:
-            if not os.path.isfile(fragment.removesuffix(".plantuml") + ".json"):
-                exit_code = subprocess.call(args=["node", PLANTUML_PARSER, fragment])
-                if exit_code != 0:
-                    raise Warning("Did not generate json properly: {}", json_file)
-
-        results[model_name] = assemble.assemble(
-            [
-                inquire.get_json_uml_fragment(f.removesuffix(".plantuml") + ".json")
-                for f in fragments
-            ]
+    if not native_parser:
+        # create all the missing json at once
+        inquire.convert_missing_json(
+            [f for fragments in grouped_fragments.values() for f in fragments]
         )
 
+    for model_name, fragments in grouped_fragments.items():
+        if native_parser:
+            results[model_name] = assemble.assemble(
+                [inquire.get_plantuml_uml(f) for f in fragments]
+            )
+            continue
+
+        json_files = [f.removesuffix(".plantuml") + ".json" for f in fragments]
+        results[model_name] = assemble.assemble(inquire.load_many(json_files))
+
     # metric
     passed = 0
     passed_predictions: list[uml.UML] = []
@@ -390,24 +427,16 @@ def test_assembly_ground_truth_plantuml(selective: str = ""):
     failed_predictions: list[uml.UML] = []
     failed_models: list[uml.UML] = []
 
+    if not native_parser:
+        # parse every missing ground truth in one node process
+        zoo_dir = inquire.DATASET.zoo_dir
+        inquire.convert_missing_json(
+            [os.path.join(zoo_dir, name + ".plantuml") for name in results]
+        )
+
     # Compare the assembled result with ground truth, version "zoo plantuml"
-    # This depends on the plantuml parser
     for model_name, assembled in results.items():
-        json_file = os.path.join(ZOO_DIR, model_name + ".json")
-        if not os.path.isfile(json_file):
-            # parse the plantuml with the node package
-            exit_code = subprocess.call(
-                args=[
-                    "node",
-                    PLANTUML_PARSER,
-                    json_file.removesuffix(".json") + ".plantuml",
-                ]
-            )
-
-            if exit_code != 0:
-                raise Warning("Did not generate json properly: {}", json_file)
-
-        ground_truth = inquire.get_json_uml(json_file)
+        ground_truth = get_ground_truth(model_name, native_parser)
 
         if assembled == ground_truth:
             # correct
@@ -453,6 +482,249 @@ def test_assembly_ground_truth_plantuml(selective: str = ""):
     )
 
 
+def exact_fragments(fragment_count: int, rel_first: bool = False):
+    """
+    Synthetic fragments naming their classes exactly, see
+    benchmark.synthetic_fragments, in shuffled order. With rel_first, a rel
+    fragment comes first, then a class fragment with attributes.
+
+    Returns (fragments, ground truth model)
+    """
+    fragments, ground_truth = benchmark.synthetic_fragments(
+        fragment_count, name_collisions=0, name_variants=False
+    )
+    if rel_first:
+        first_rel = next(f for f in fragments if f.classes[0].kind == "rel")
+        first_class = next(
+            f
+            for f in fragments
+            if f.classes[0].kind == "class" and len(f.classes[0].attributes) != 0
+        )
+        fragments = [first_rel, first_class] + [
+            f for f in fragments if f is not first_rel and f is not first_class
+        ]
+    return fragments, ground_truth
+
+
+def test_assembly_tree_reduction(fragment_count: int = 6000):
+    """
+    Checks that the parallel tree assembly matches the sequential assembly,
+    up to ordering, on synthetic fragments naming their classes exactly.
+
+    Once in shuffled order, once with a rel fragment first.
+    """
+    for rel_first in (False, True):
+        sequential = assemble.assemble(exact_fragments(fragment_count, rel_first)[0])
+        tree = assemble.assemble_tree(
+            exact_fragments(fragment_count, rel_first)[0], partition_size=500
+        )
+        assert assemble.same_up_to_ordering(sequential, tree), rel_first
+
+    print("Passed", 2)
+
+
+def test_assembly_first_fragment_rel():
+    """
+    A rel fragment given first does not make the first class fragment get lost
+    """
+    _, expected = exact_fragments(30, rel_first=True)
+
+    sequential = assemble.assemble(exact_fragments(30, rel_first=True)[0])
+    assert assemble.same_up_to_ordering(sequential, expected)
+    tree = assemble.assemble_tree(
+        exact_fragments(30, rel_first=True)[0], partition_size=1
+    )
+    assert assemble.same_up_to_ordering(tree, expected)
+
+    # streaming agrees with assemble
+    assembler = assemble.Assembler()
+    for fragment in exact_fragments(30, rel_first=True)[0]:
+        assembler.add_fragment(fragment)
+    assert assemble.same_up_to_ordering(assembler.snapshot(), expected)
+
+    print("Passed", 3)
+
+
+def test_streaming_assembly_fuzzy_release():
+    """
+    A waiting rel is merged when a class with a similar name arrives
+    """
+
+    def make_fragments():
+        fragments, ground_truth = exact_fragments(25)
+        # every rel first, one of them with a typo in its destination
+        rels = [f for f in fragments if f.classes[0].kind == "rel"]
+        classes = [f for f in fragments if f.classes[0].kind == "class"]
+        misspelled = next(f for f in rels if f.classes[0].name != f.classes[1].name)
+        destination = misspelled.classes[1]
+        destination.name = destination.name.replace("Class", "Classs")
+        return rels, classes, misspelled, ground_truth
+
+    rels, classes, misspelled, expected = make_fragments()
+    assembler = assemble.Assembler(fuzzy_threshold=0.8)
+    for fragment in rels:
+        assembler.add_fragment(fragment)
+    assert id(misspelled) in assembler.waiting_rels
+    for fragment in classes:
+        assembler.add_fragment(fragment)
+    assert len(assembler.waiting_rels) == 0
+
+    assert assemble.same_up_to_ordering(assembler.snapshot(), expected)
+    rels, classes, _, _ = make_fragments()
+    assert assemble.same_up_to_ordering(
+        assemble.assemble(rels + classes, 0.8), expected
+    )
+
+    print("Passed", 1)
+
+
+def test_edges_after_union():
+    """
+    An association keeps matching after its destination is merged into a
+    similar class
+    """
+    customer = uml.UMLClass("Customer", "class")
+    order = uml.UMLClass("Order", "class")
+    # to a class outside of the model, only its name is known
+    order.association(uml.UMLClass("Custommer", "class"), "", "places")
+    model = uml.UML("Order")
+    model.classes = [customer, order]
+
+    index = assemble.ClassIndex(model, None, fuzzy_threshold=0.5)
+    assert index.resolve("Custommer") is customer
+    index.associate(order, customer, "1", "places")
+
+    assert len(order.associations) == 1
+    assert order.associations[0].multiplicity == "1"
+
+    print("Passed", 1)
+
+
+def test_ground_truth_routes_agree():
+    """
+    The native parser and the plantuml-parser json read the same
+    multiplicities and names
+    """
+    # left cardinality, right cardinality, label
+    relationships = [
+        ("1", "*", "owns"),
+        ("items 0..*", "", ""),
+        ("", "", "uses"),
+        ("1..*", "0..1", ""),
+    ]
+
+    lines = ["@startuml", "package Shop {", "class Order", "class Item"]
+    elements = [
+        {"name": "Order", "members": []},
+        {"name": "Item", "members": []},
+    ]
+    for left, right, label in relationships:
+        line = "Order"
+        line += f' "{left}"' if left != "" else ""
+        line += " -->"
+        line += f' "{right}"' if right != "" else ""
+        line += " Item"
+        line += f" : {label}" if label != "" else ""
+        lines.append(line)
+        elements.append(
+            {
+                "left": "Order",
+                "right": "Item",
+                "leftCardinality": left,
+                "rightCardinality": right,
+                "label": label,
+            }
+        )
+    lines += ["}", "@enduml"]
+
+    plantuml_file = os.path.join(TEMP_FOLDER, "routes.plantuml")
+    json_file = os.path.join(TEMP_FOLDER, "routes.json")
+    with open(plantuml_file, "w") as file_object:
+        file_object.write("\n".join(lines) + "\n")
+    with open(json_file, "w") as file_object:
+        json.dump(
+            {"elements": [{"type": "package", "name": "Shop", "elements": elements}]},
+            file_object,
+        )
+
+    native = inquire.get_plantuml_uml(plantuml_file)
+    parsed = inquire.load_json_uml(json_file)
+    assert native.to_string() == parsed.to_string()
+    assert [
+        (association.multiplicity, association.name)
+        for association in native.classes[0].associations
+    ] == [("1..*", "owns"), ("0..*", "items"), ("", "uses"), ("1..*", "")]
+
+    print("Passed", len(relationships))
+
+
+def test_zoo_relationship_routes():
+    """
+    A zoo fragment line A "1" --> "*" B : label reads as 1..* named after the
+    label through both routes. The json route used to read 1 and no name.
+    """
+    plantuml_file = os.path.join(TEMP_FOLDER, "zoo_fragment.plantuml")
+    json_file = os.path.join(TEMP_FOLDER, "zoo_fragment.json")
+    with open(plantuml_file, "w") as file_object:
+        file_object.write('@startuml\nOrder "1" --> "*" Item : owns\n@enduml\n')
+    with open(json_file, "w") as file_object:
+        json.dump(
+            {
+                "elements": [
+                    {
+                        "left": "Order",
+                        "right": "Item",
+                        "leftCardinality": "1",
+                        "rightCardinality": "*",
+                        "label": "owns",
+                    }
+                ]
+            },
+            file_object,
+        )
+
+    native = inquire.get_plantuml_uml(plantuml_file)
+    parsed = inquire.load_json_uml(json_file)
+    for model in (native, parsed):
+        assert model.package_name == "zoo_fragment"
+        assert [
+            (association.destination.name, association.multiplicity, association.name)
+            for association in model.classes[0].associations
+        ] == [("Item", "1..*", "owns")]
+
+    print("Passed", 2)
+
+
+def test_class_key():
+    """
+    Variants of a name share a key, different classes do not
+    """
+    same = [
+        ("Category", "categories"),
+        ("Order", "ORDERS"),
+        ("Box", "Boxes"),
+        ("Person", "People"),
+        ("Area", "Areas"),
+        ("Bank_Account", "bank accounts"),
+    ]
+    different = [
+        ("Status", "Statu"),
+        ("Canvas", "Canva"),
+        ("Alias", "Alia"),
+        ("News", "New"),
+        ("Series", "Sery"),
+        ("ImageCanvas", "ImageCanva"),
+        ("_", "?"),
+    ]
+
+    for first, second in same:
+        assert assemble.class_key(first) == assemble.class_key(second), first
+    for first, second in different:
+        assert assemble.class_key(first) != assemble.class_key(second), first
+
+    print("Passed", len(same) + len(different))
+
+
 if __name__ == "__main__":
     # test_assembly(used_preprocessed=True)
     test_assembly_ground_truth_plantuml(selective="CFG")
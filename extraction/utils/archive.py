@@ -0,0 +1,220 @@
+"""
+Archives of many uml models in one JSON lines file.
+
+Layout, one JSON value per line:
+- a header, {"format": "uml-archive", "version": 1}
+- one record per model, see to_record
+- the index of the records, {"index": [[name, group, offset], ...]}
+- a trailer of fixed size with the offset of the index
+
+Records are written as they come and read lazily through the index, by
+name or by group, e.g. the fragments of one model. The writer renames the
+archive into place once the index is written, an archive without an index
+is not one.
+"""
+
+import json
+import os
+import threading
+from typing import Iterator, List, Tuple
+
+from . import uml
+from .uml import as_text
+
+FORMAT = "uml-archive"
+VERSION = 1
+
+TRAILER = '{{"index_offset": "{:020d}"}}\n'
+TRAILER_SIZE = len(TRAILER.format(0))
+
+
+def to_record(model: uml.UML) -> dict:
+    """
+    Compact form of a model.
+
+    Classes are [name, kind, attributes, associations] lists where
+    attributes are [name, type] pairs and associations [destination,
+    multiplicity, name] with destination the position of the class in the
+    list. Destinations that are not classes of the model follow the first
+    "count" classes, see uml.UML.flat_classes.
+    """
+    classes = [
+        [
+            as_text(name),
+            as_text(kind),
+            [
+                [as_text(attribute_name), as_text(attribute_type)]
+                for attribute_name, attribute_type in attributes
+            ],
+            [
+                [destination, as_text(multiplicity), as_text(association_name)]
+                for destination, multiplicity, association_name in associations
+            ],
+        ]
+        for name, kind, attributes, associations in model.flat_classes()
+    ]
+
+    return {
+        "package": as_text(model.package_name),
+        "count": len(model.classes),
+        "classes": classes,
+    }
+
+
+def from_record(record: dict) -> uml.UML:
+    model = uml.UML(record["package"])
+    model.classes = uml.unflatten_classes(record["classes"], record["count"])
+    return model
+
+
+class ArchiveWriter:
+    """
+    Writes models to an archive, one at a time.
+
+    The archive is written next to its path and renamed over it on close(),
+    so readers never see a partial archive.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        self.temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.file = open(self.temporary_path, "xb")
+        # name, group, offset of every record
+        self.index: List[Tuple[str, str, int]] = []
+        self._write_line({"format": FORMAT, "version": VERSION})
+
+    def _write_line(self, value):
+        self.file.write(
+            json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+            + b"\n"
+        )
+
+    def add(self, name: str, model: uml.UML, group: str = ""):
+        """
+        Adds a model under a name, and a group like the model of a fragment
+        """
+        record = to_record(model)
+        record["name"] = name
+        record["group"] = group
+
+        self.index.append((name, group, self.file.tell()))
+        self._write_line(record)
+        return self
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        index_offset = self.file.tell()
+        self._write_line({"index": self.index})
+        self.file.write(TRAILER.format(index_offset).encode())
+        self.file.close()
+        os.replace(self.temporary_path, self.path)
+
+    def abort(self):
+        """
+        Drops the archive being written, an existing archive stays as it was
+        """
+        if not self.file.closed:
+            self.file.close()
+        if os.path.exists(self.temporary_path):
+            os.remove(self.temporary_path)
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ArchiveReader:
+    """
+    Reads the models of an archive lazily, by name or by group
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.file = open(path, "rb")
+
+        header = json.loads(self.file.readline())
+        if header.get("format") != FORMAT:
+            raise Exception("Not a uml archive: {}".format(path))
+        if header.get("version") != VERSION:
+            raise Exception(
+                "Unsupported uml archive version {} in {}".format(
+                    header.get("version"), path
+                )
+            )
+        self._records_offset = self.file.tell()
+
+        # name, group, offset of every record
+        self.index: List[Tuple[str, str, int]] = self._read_index()
+        # name -> offset, the last record of a name wins
+        self.offsets = {name: offset for name, _, offset in self.index}
+        # group -> offsets, in archive order
+        self.groups: dict[str, List[int]] = {}
+        for _, group, offset in self.index:
+            self.groups.setdefault(group, []).append(offset)
+
+    def _read_index(self) -> List[Tuple[str, str, int]]:
+        size = os.fstat(self.file.fileno()).st_size
+        if size - self._records_offset >= TRAILER_SIZE:
+            self.file.seek(size - TRAILER_SIZE)
+            try:
+                trailer = json.loads(self.file.read(TRAILER_SIZE))
+                self.file.seek(int(trailer["index_offset"]))
+                index = json.loads(self.file.readline())["index"]
+                return [tuple(entry) for entry in index]
+            except (ValueError, KeyError, TypeError):
+                pass
+
+        self.file.close()
+        raise Exception("No index in uml archive {}, truncated?".format(self.path))
+
+    def _read_at(self, offset: int) -> uml.UML:
+        self.file.seek(offset)
+        return from_record(json.loads(self.file.readline()))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.offsets
+
+    def names(self) -> List[str]:
+        return [name for name, _, _ in self.index]
+
+    def read(self, name: str) -> uml.UML:
+        """
+        The model of this name
+        """
+        return self._read_at(self.offsets[name])
+
+    def group(self, group: str) -> List[uml.UML]:
+        """
+        The models of a group, in the order they were added
+        """
+        return [self._read_at(offset) for offset in self.groups.get(group, [])]
+
+    def __iter__(self) -> Iterator[Tuple[str, str, uml.UML]]:
+        """
+        (name, group, model) of every record, in archive order
+        """
+        for name, group, offset in self.index:
+            yield name, group, self._read_at(offset)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
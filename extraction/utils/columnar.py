@@ -0,0 +1,448 @@
+"""
+Columnar store of uml models, for evaluating and querying whole corpora.
+
+A ModelStore holds a corpus in three tables of NumPy arrays:
+- classes: model, name, kind
+- attributes: class, name, type
+- associations: source class, destination class, multiplicity, name
+
+Names are integer ids into one string table, None is -1. The rows of a
+model, and the attributes and associations of a class, are contiguous and
+in their original order, offsets arrays give where they start.
+
+Conversion from and to uml.UML is lossless, up to package names that are
+not strings being stored as their str().
+"""
+
+from typing import List, Tuple
+
+import networkx
+import numpy
+
+from . import uml
+
+NONE = -1
+
+
+class StringTable:
+    """
+    Ids of strings, None is NONE
+    """
+
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.strings: List[str] = []
+
+    def id(self, value) -> int:
+        if value is None:
+            return NONE
+        if type(value) is not str:
+            value = str(value)
+
+        string_id = self.ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[value] = string_id
+            self.strings.append(value)
+        return string_id
+
+    def string(self, string_id: int):
+        if string_id == NONE:
+            return None
+        return self.strings[string_id]
+
+
+class ModelStore:
+    """
+    A corpus of models in columns, see from_models and to_models.
+
+    Destinations of associations that are not classes of their model get a
+    row of the model after its classes, flagged external, so that they come
+    back as the same objects outside of the model's classes.
+    """
+
+    def __init__(self) -> None:
+        self.strings = StringTable()
+
+        # per model
+        self.package_names = numpy.zeros(0, dtype=numpy.int32)
+        # rows of the classes of model i: class_offsets[i] to class_offsets[i + 1]
+        self.class_offsets = numpy.zeros(1, dtype=numpy.int64)
+        # number of rows of the model that are its classes, the others are external
+        self.class_counts = numpy.zeros(0, dtype=numpy.int64)
+
+        # per class row
+        self.class_model = numpy.zeros(0, dtype=numpy.int32)
+        self.class_name = numpy.zeros(0, dtype=numpy.int32)
+        self.class_kind = numpy.zeros(0, dtype=numpy.int32)
+        self.class_external = numpy.zeros(0, dtype=bool)
+        self.attribute_offsets = numpy.zeros(1, dtype=numpy.int64)
+        self.association_offsets = numpy.zeros(1, dtype=numpy.int64)
+
+        # per attribute row
+        self.attribute_class = numpy.zeros(0, dtype=numpy.int64)
+        self.attribute_name = numpy.zeros(0, dtype=numpy.int32)
+        self.attribute_type = numpy.zeros(0, dtype=numpy.int32)
+
+        # per association row
+        self.association_source = numpy.zeros(0, dtype=numpy.int64)
+        self.association_destination = numpy.zeros(0, dtype=numpy.int64)
+        self.association_multiplicity = numpy.zeros(0, dtype=numpy.int32)
+        self.association_name = numpy.zeros(0, dtype=numpy.int32)
+
+    def __len__(self) -> int:
+        return len(self.package_names)
+
+    @classmethod
+    def from_models(cls, models: List[uml.UML]) -> "ModelStore":
+        store = cls()
+        strings = store.strings
+
+        package_names = []
+        class_offsets = [0]
+        class_counts = []
+        class_model, class_name, class_kind, class_external = [], [], [], []
+        attribute_offsets, association_offsets = [0], [0]
+        attribute_class, attribute_name, attribute_type = [], [], []
+        association_source, association_destination = [], []
+        association_multiplicity, association_name = [], []
+
+        for model_position, model in enumerate(models):
+            package_names.append(strings.id(model.package_name))
+            first_row = class_offsets[-1]
+
+            # external destinations follow the classes of the model
+            flat = model.flat_classes()
+            class_counts.append(len(model.classes))
+
+            for position, (name, kind, attributes, associations) in enumerate(flat):
+                row = first_row + position
+
+                class_model.append(model_position)
+                class_name.append(strings.id(name))
+                class_kind.append(strings.id(kind))
+                class_external.append(position >= class_counts[-1])
+
+                for name, attribute_type_name in attributes:
+                    attribute_class.append(row)
+                    attribute_name.append(strings.id(name))
+                    attribute_type.append(strings.id(attribute_type_name))
+                attribute_offsets.append(len(attribute_class))
+
+                for destination, multiplicity, name in associations:
+                    association_source.append(row)
+                    association_destination.append(first_row + destination)
+                    association_multiplicity.append(strings.id(multiplicity))
+                    association_name.append(strings.id(name))
+                association_offsets.append(len(association_source))
+
+            class_offsets.append(first_row + len(flat))
+
+        store.package_names = numpy.array(package_names, dtype=numpy.int32)
+        store.class_offsets = numpy.array(class_offsets, dtype=numpy.int64)
+        store.class_counts = numpy.array(class_counts, dtype=numpy.int64)
+        store.class_model = numpy.array(class_model, dtype=numpy.int32)
+        store.class_name = numpy.array(class_name, dtype=numpy.int32)
+        store.class_kind = numpy.array(class_kind, dtype=numpy.int32)
+        store.class_external = numpy.array(class_external, dtype=bool)
+        store.attribute_offsets = numpy.array(attribute_offsets, dtype=numpy.int64)
+        store.association_offsets = numpy.array(association_offsets, dtype=numpy.int64)
+        store.attribute_class = numpy.array(attribute_class, dtype=numpy.int64)
+        store.attribute_name = numpy.array(attribute_name, dtype=numpy.int32)
+        store.attribute_type = numpy.array(attribute_type, dtype=numpy.int32)
+        store.association_source = numpy.array(association_source, dtype=numpy.int64)
+        store.association_destination = numpy.array(
+            association_destination, dtype=numpy.int64
+        )
+        store.association_multiplicity = numpy.array(
+            association_multiplicity, dtype=numpy.int32
+        )
+        store.association_name = numpy.array(association_name, dtype=numpy.int32)
+        return store
+
+    def model(self, position: int) -> uml.UML:
+        """
+        The model at this position as uml.UML
+        """
+        string = self.strings.string
+        first_row = int(self.class_offsets[position])
+        last_row = int(self.class_offsets[position + 1])
+
+        classes = [
+            uml.UMLClass(
+                string(int(self.class_name[row])), string(int(self.class_kind[row]))
+            )
+            for row in range(first_row, last_row)
+        ]
+
+        for row, uml_class in zip(range(first_row, last_row), classes):
+            for attribute_row in range(
+                self.attribute_offsets[row], self.attribute_offsets[row + 1]
+            ):
+                uml_class.attribute(
+                    string(int(self.attribute_name[attribute_row])),
+                    string(int(self.attribute_type[attribute_row])),
+                )
+
+            for association_row in range(
+                self.association_offsets[row], self.association_offsets[row + 1]
+            ):
+                uml_class.association(
+                    classes[self.association_destination[association_row] - first_row],
+                    string(int(self.association_multiplicity[association_row])),
+                    string(int(self.association_name[association_row])),
+                )
+
+        model = uml.UML(string(int(self.package_names[position])))
+        model.classes = classes[: self.class_counts[position]]
+        return model
+
+    def to_models(self) -> List[uml.UML]:
+        return [self.model(position) for position in range(len(self))]
+
+    def _model_rows(self, model_positions: numpy.ndarray = None) -> numpy.ndarray:
+        # classes of their models, not the external destinations
+        keep = ~self.class_external
+        if model_positions is not None:
+            keep &= numpy.isin(self.class_model, model_positions)
+        return numpy.flatnonzero(keep)
+
+    def duplicate_classes(self, model_positions: numpy.ndarray = None) -> numpy.ndarray:
+        """
+        Rows of the classes whose name appears earlier in their model, in the
+        models at these positions, all models by default
+        """
+        rows = self._model_rows(model_positions)
+        keys = numpy.stack([self.class_model[rows], self.class_name[rows]], axis=1)
+        return rows[_repeated(keys)]
+
+    def duplicate_associations(
+        self, model_positions: numpy.ndarray = None
+    ) -> numpy.ndarray:
+        """
+        Rows of the associations repeating an earlier association of their
+        source: same destination name, multiplicity and name
+        """
+        rows = numpy.arange(len(self.association_source))
+        if model_positions is not None:
+            rows = rows[
+                numpy.isin(self.class_model[self.association_source], model_positions)
+            ]
+
+        keys = numpy.stack(
+            [
+                self.association_source[rows],
+                self.class_name[self.association_destination[rows]],
+                self.association_multiplicity[rows],
+                self.association_name[rows],
+            ],
+            axis=1,
+        )
+        return rows[_repeated(keys)]
+
+    def check_integrity(self, model_positions: numpy.ndarray = None):
+        """
+        Same checks as metrics.check_model_integrity, for every model at once
+        """
+        duplicates = self.duplicate_classes(model_positions)
+        if len(duplicates) != 0:
+            raise Exception(
+                "Model contains duplicate classes: {}".format(
+                    self.strings.string(int(self.class_name[duplicates[0]]))
+                )
+            )
+
+        duplicates = self.duplicate_associations(model_positions)
+        if len(duplicates) != 0:
+            row = duplicates[0]
+            string = self.strings.string
+            raise Exception(
+                "Model contains duplicate relations: {} {} {}".format(
+                    string(int(self.class_name[self.association_destination[row]])),
+                    string(int(self.association_multiplicity[row])),
+                    string(int(self.association_name[row])),
+                )
+            )
+
+    def relations(self, model_positions: numpy.ndarray = None) -> numpy.ndarray:
+        """
+        (model, source name, destination name, name, multiplicity) rows of the
+        associations of the classes of the models, all models by default
+        """
+        sources = self.association_source
+        keep = ~self.class_external[sources]
+        if model_positions is not None:
+            keep &= numpy.isin(self.class_model[sources], model_positions)
+
+        sources = sources[keep]
+        return numpy.stack(
+            [
+                self.class_model[sources].astype(numpy.int64),
+                self.class_name[sources],
+                self.class_name[self.association_destination[keep]],
+                self.association_name[keep],
+                self.association_multiplicity[keep],
+            ],
+            axis=1,
+        )
+
+    def graph(self, position: int) -> networkx.MultiGraph:
+        """
+        Same graph as uml.UML.get_graph_object for the model at this position
+        """
+        string = self.strings.string
+        first_row = self.class_offsets[position]
+        rows = numpy.arange(first_row, first_row + self.class_counts[position])
+
+        graph = networkx.MultiGraph()
+        graph.add_nodes_from(string(int(name)) for name in self.class_name[rows])
+
+        relations = self.relations(numpy.array([position]))
+        graph.add_edges_from(
+            (
+                string(int(source)),
+                string(int(destination)),
+                {"mult": string(int(multiplicity)), "name": string(int(name))},
+            )
+            for _, source, destination, name, multiplicity in relations
+        )
+        return graph
+
+
+def _repeated(keys: numpy.ndarray) -> numpy.ndarray:
+    """
+    Mask of the rows of keys equal to an earlier row
+    """
+    if len(keys) == 0:
+        return numpy.zeros(0, dtype=bool)
+
+    _, first_positions = numpy.unique(keys, axis=0, return_index=True)
+    repeated = numpy.ones(len(keys), dtype=bool)
+    repeated[first_positions] = False
+    return repeated
+
+
+def _matched(keys: numpy.ndarray, other_keys: numpy.ndarray) -> numpy.ndarray:
+    """
+    Mask of the rows of keys found in other_keys
+    """
+    if len(keys) == 0 or len(other_keys) == 0:
+        return numpy.zeros(len(keys), dtype=bool)
+
+    _, inverse = numpy.unique(
+        numpy.concatenate([keys, other_keys]), axis=0, return_inverse=True
+    )
+    inverse = inverse.reshape(-1)
+    return numpy.isin(inverse[: len(keys)], inverse[len(keys) :])
+
+
+def _scores(
+    matches: numpy.ndarray, predicted: numpy.ndarray, ground: numpy.ndarray
+) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    """
+    Precision and recall per model, from counts of matches, predictions and
+    ground truth, with the conventions of metrics.get_model_metrics_rels for
+    empty models
+    """
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        precision = numpy.where(
+            predicted != 0, matches / predicted, numpy.where(ground != 0, 0.0, 1.0)
+        )
+        recall = numpy.where(ground != 0, matches / ground, 1.0)
+    return precision, recall
+
+
+def _f1_scores(precision: numpy.ndarray, recall: numpy.ndarray) -> numpy.ndarray:
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        f1_score = 2 * (precision * recall) / (precision + recall)
+    return numpy.where(precision + recall != 0, f1_score, 0.0)
+
+
+def compute_metrics(predictions: List[uml.UML], ground_truth: List[uml.UML]):
+    """
+    Same results as metrics.compute_metrics, computed over the whole corpus
+    at once
+    """
+    if len(predictions) != len(ground_truth):
+        raise Exception("Disagreement in length")
+
+    if len(predictions) == 0 or len(ground_truth) == 0:
+        raise Exception("Empty lists to compare")
+
+    count = len(predictions)
+    # predictions first, the ground truth of prediction i is model count + i
+    store = ModelStore.from_models(list(predictions) + list(ground_truth))
+
+    # the null result is not checked, like in metrics
+    nothing = store.strings.ids.get("Nothing", NONE)
+    null_results = store.package_names[:count] == nothing
+    checked = numpy.flatnonzero(~null_results)
+    store.check_integrity(numpy.concatenate([checked, count + checked]))
+
+    # classes match by name, see metrics.compare_classes_name_only
+    rows = store._model_rows()
+    pair = store.class_model[rows] % count
+    is_prediction = store.class_model[rows] < count
+    keys = numpy.stack([pair, store.class_name[rows]], axis=1)
+
+    predicted_classes = numpy.bincount(pair[is_prediction], minlength=count)
+    ground_classes = numpy.bincount(pair[~is_prediction], minlength=count)
+    matched_predictions = _matched(keys[is_prediction], keys[~is_prediction])
+    matched_ground = _matched(keys[~is_prediction], keys[is_prediction])
+
+    # no classes gives 0 where metrics divides by zero
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        class_precision = numpy.where(
+            predicted_classes != 0,
+            numpy.bincount(pair[is_prediction][matched_predictions], minlength=count)
+            / predicted_classes,
+            0.0,
+        )
+        class_recall = numpy.where(
+            ground_classes != 0,
+            numpy.bincount(pair[~is_prediction][matched_ground], minlength=count)
+            / ground_classes,
+            0.0,
+        )
+    class_f1 = _f1_scores(class_precision, class_recall)
+
+    # relations match exactly, see metrics.get_model_metrics_rels
+    relations = store.relations()
+    pair = relations[:, 0] % count
+    is_prediction = relations[:, 0] < count
+    keys = numpy.concatenate([pair[:, None], relations[:, 1:]], axis=1)
+
+    predicted_relations = numpy.bincount(pair[is_prediction], minlength=count)
+    ground_relations = numpy.bincount(pair[~is_prediction], minlength=count)
+    matched = _matched(keys[is_prediction], keys[~is_prediction])
+    relation_matches = numpy.bincount(pair[is_prediction][matched], minlength=count)
+
+    rel_precision, rel_recall = _scores(
+        relation_matches, predicted_relations, ground_relations
+    )
+    rel_f1 = _f1_scores(rel_precision, rel_recall)
+
+    class_results = []
+    rel_results = []
+    for position in range(count):
+        if null_results[position]:
+            class_results.append((0, 0, 0))
+            rel_results.append((0, 0, 0))
+            continue
+
+        class_results.append(
+            (
+                float(class_precision[position]),
+                float(class_recall[position]),
+                float(class_f1[position]),
+            )
+        )
+        rel_results.append(
+            (
+                float(rel_precision[position]),
+                float(rel_recall[position]),
+                float(rel_f1[position]),
+            )
+        )
+
+    return class_results, rel_results
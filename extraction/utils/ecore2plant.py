@@ -1,6 +1,11 @@
 # https://gist.github.com/aranega/eca9c8fbbd87b2f9c70317da53676ac6
 # Usage
 # https://github.com/pyecore/pyecore/issues/104
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
 from pyecore.resources import ResourceSet
 from pyecore.utils import dispatch
 import pyecore.ecore as ecore
@@ -9,33 +14,38 @@ import pyecore.ecore as ecore
 class PlantUMLSwitch(object):
     def __init__(self):
         self.visited = set()
+        self.lines = []
+
+    def emit(self, *values):
+        # same text as print, kept until the whole diagram is written
+        self.lines.append(' '.join(str(value) for value in values) + '\n')
 
     @dispatch
     def generate(self, o):
-        print('Object kind unsupported', o.eClass.name)
+        self.emit('Object kind unsupported', o.eClass.name)
 
     @generate.register(ecore.EPackage)
     def epackage_switch(self, p):
-        print('package', p.name, '{')
+        self.emit('package', p.name, '{')
         for classif in p.eClassifiers:
             self.generate(classif)
-        print('}')
+        self.emit('}')
 
     @generate.register(ecore.EClass)
     def eclass_switch(self, o):
         kind = 'interface' if o.interface else 'class'
-        print(kind, o.name, '{')
+        self.emit(kind, o.name, '{')
         for attrib in o.eAttributes:
             self.generate(attrib)
-        print('}')
+        self.emit('}')
         for sclass in o.eSuperTypes:
-            print(sclass.name, '<|--', o.name)
+            self.emit(sclass.name, '<|--', o.name)
         for ref in o.eReferences:
             self.generate(ref)
 
     @generate.register(ecore.EAttribute)
     def eattribute_switch(self, a):
-        print('\t', a.name, ':', a.eType.name)
+        self.emit('\t', a.name, ':', a.eType.name)
 
     @generate.register(ecore.EReference)
     def ereference_switch(self, ref):
@@ -53,35 +63,130 @@ class PlantUMLSwitch(object):
             o_label = f"{o.name} {o.lower}..{'*' if o.many else o.upper}"
             if o.containment:
                 link += '*'
-            print(f'{ref.eContainer().name} "{label}" {link} "{o_label}" {ref.eType.name}')
+            self.emit(f'{ref.eContainer().name} "{label}" {link} "{o_label}" {ref.eType.name}')
         else:
             link += '>'
-            print(f'{ref.eContainer().name} "{label}" {link} {ref.eType.name}')
+            self.emit(f'{ref.eContainer().name} "{label}" {link} {ref.eType.name}')
 
     @generate.register(ecore.EEnum)
     def enum_switch(self, o):
-        print('enum', o.name, '{')
+        self.emit('enum', o.name, '{')
         for literal in o.eLiterals:
-            print(literal.name)
-        print('}')
+            self.emit(literal.name)
+        self.emit('}')
 
     @generate.register(ecore.EDataType)
     def edatatype_switch(self, o):
-        print('class', o.name, '<< (D,orchid) EDataType>>')
+        self.emit('class', o.name, '<< (D,orchid) EDataType>>')
 
 
-def generate(mm):
-    print('@startuml')
-    print('!theme plain')
+def to_plantuml(mm):
     switch = PlantUMLSwitch()
+    switch.emit('@startuml')
+    switch.emit('!theme plain')
     switch.generate(mm)
-    print('@enduml')
+    switch.emit('@enduml')
+    return ''.join(switch.lines)
+
+
+def generate(mm, stream=None):
+    # one write for the whole diagram
+    (stream or sys.stdout).write(to_plantuml(mm))
+
+
+def convert(ecore_path, plantuml_path):
+    """
+    Writes the PlantUML of an ecore file, through a temporary file renamed
+    over the destination
+    """
+    rset = ResourceSet()
+    metamodel_resource = rset.get_resource(ecore_path)
+    text = to_plantuml(metamodel_resource.contents[0])
+
+    temporary_path = f'{plantuml_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(temporary_path, 'w') as plantuml_file:
+            plantuml_file.write(text)
+        os.replace(temporary_path, plantuml_path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def _convert_job(paths):
+    ecore_path, plantuml_path = paths
+    try:
+        convert(ecore_path, plantuml_path)
+    except Exception as error:
+        return ecore_path, f'{type(error).__name__}: {error}'
+    return ecore_path, None
+
+
+def convert_directory(source_dir, destination_dir=None, force=False, max_workers=None):
+    """
+    Converts every .ecore file of a directory in a process pool.
+
+    A .plantuml newer than both its .ecore and this converter is up to date
+    and skipped, unless force. Failures are collected, not raised.
+
+    Returns (converted, skipped, failed) with failed (path, error) pairs.
+    """
+    destination_dir = destination_dir or source_dir
+    os.makedirs(destination_dir, exist_ok=True)
+
+    # a change of the converter makes every output out of date
+    converter_mtime = os.stat(__file__).st_mtime_ns
+
+    jobs = []
+    skipped = []
+    for file_name in sorted(os.listdir(source_dir)):
+        if not file_name.endswith('.ecore'):
+            continue
+        ecore_path = os.path.join(source_dir, file_name)
+        plantuml_path = os.path.join(
+            destination_dir, file_name.removesuffix('.ecore') + '.plantuml'
+        )
+        if (
+            not force
+            and os.path.isfile(plantuml_path)
+            and os.stat(plantuml_path).st_mtime_ns
+            >= max(os.stat(ecore_path).st_mtime_ns, converter_mtime)
+        ):
+            skipped.append(ecore_path)
+            continue
+        jobs.append((ecore_path, plantuml_path))
+
+    converted = []
+    failed = []
+    if len(jobs) != 0:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for ecore_path, error in executor.map(_convert_job, jobs, chunksize=16):
+                if error is None:
+                    converted.append(ecore_path)
+                else:
+                    failed.append((ecore_path, error))
+
+    return converted, skipped, failed
 
 
 if __name__ == '__main__':
-    import sys
+    if len(sys.argv) >= 3 and sys.argv[1] == '--batch':
+        arguments = [argument for argument in sys.argv[2:] if argument != '--force']
+        converted, skipped, failed = convert_directory(
+            *arguments[:2], force='--force' in sys.argv
+        )
+        print(
+            f'Converted {len(converted)}, up to date {len(skipped)}, '
+            f'failed {len(failed)}'
+        )
+        for ecore_path, error in failed:
+            print(ecore_path, error, file=sys.stderr)
+        sys.exit(1 if len(failed) != 0 else 0)
+
     if len(sys.argv) < 2:
         print(f"Usage: {sys.argv[0]} ecore_file")
+        print(f"       {sys.argv[0]} --batch ecore_dir [plantuml_dir] [--force]")
         sys.exit(1)
     rset = ResourceSet()
     metamodel_resource = rset.get_resource(sys.argv[1])
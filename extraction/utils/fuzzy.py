@@ -0,0 +1,150 @@
+"""
+Approximate matching of class and attribute names.
+
+Names are compared by the Jaccard similarity of their character trigrams.
+Candidates come from a MinHash index with banding (locality sensitive
+hashing): a query only looks at the names that share a bucket with it, not at
+every name of the model.
+"""
+
+import heapq
+import zlib
+from typing import Any, Callable, List, Tuple
+
+import numpy
+
+NGRAM_SIZE = 3
+
+# 16 bands of 2 hashes: a pair of names with a trigram similarity of 0.5 shares
+# a bucket with a probability of 0.99, at 0.2 with a probability of 0.48
+BANDS = 16
+ROWS = 2
+
+# mersenne prime, small enough for the products of the hashes to fit in int64
+PRIME = (1 << 31) - 1
+
+
+def normalize_name(name: str) -> str:
+    return "".join(character for character in name.lower() if character.isalnum())
+
+
+def ngrams(key: str, size: int = NGRAM_SIZE) -> frozenset:
+    """
+    Character n-grams of a key, padded so that short keys have some too
+    """
+    padded = f"#{key}#"
+    if len(padded) <= size:
+        return frozenset([padded])
+    return frozenset(
+        padded[start : start + size] for start in range(len(padded) - size + 1)
+    )
+
+
+def jaccard(first: frozenset, second: frozenset) -> float:
+    if not first and not second:
+        return 1.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+class NameIndex:
+    """
+    Index of names for top-k similarity queries.
+
+    Names are normalized before anything else, by lowercase alphanumerics or
+    by the given function. Every normalized name keeps the values it was
+    added with.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.5,
+        bands: int = BANDS,
+        rows: int = ROWS,
+        normalize: Callable[[str], str] = normalize_name,
+        seed: int = 0,
+    ) -> None:
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.normalize = normalize
+
+        # one (a, b) per hash function, h(x) = (a * x + b) mod PRIME
+        generator = numpy.random.default_rng(seed)
+        shape = (bands * rows, 1)
+        self._a = generator.integers(1, PRIME, size=shape, dtype=numpy.int64)
+        self._b = generator.integers(0, PRIME, size=shape, dtype=numpy.int64)
+
+        # key -> n-grams of the key
+        self.grams: dict[str, frozenset] = {}
+        # key -> values added under the key
+        self.values: dict[str, List[Any]] = {}
+        # one dict per band, band signature -> keys
+        self._buckets: List[dict[Tuple[int, ...], List[str]]] = [
+            {} for _ in range(bands)
+        ]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def _signature(self, grams: frozenset) -> List[int]:
+        # crc32 keeps the hashes the same across processes, unlike hash()
+        hashes = numpy.fromiter(
+            (zlib.crc32(gram.encode()) % PRIME for gram in grams),
+            dtype=numpy.int64,
+            count=len(grams),
+        )
+        return ((self._a * hashes + self._b) % PRIME).min(axis=1).tolist()
+
+    def _bands(self, grams: frozenset):
+        signature = self._signature(grams)
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows : (band + 1) * self.rows])
+
+    def add(self, name: str, value: Any = None):
+        """
+        Adds a name, with a value returned by the queries matching it
+        """
+        key = self.normalize(name)
+        values = self.values.get(key)
+        if values is not None:
+            values.append(value)
+            return self
+
+        self.values[key] = [value]
+        grams = ngrams(key)
+        self.grams[key] = grams
+        for band, band_signature in self._bands(grams):
+            self._buckets[band].setdefault(band_signature, []).append(key)
+        return self
+
+    def query(
+        self, name: str, k: int = 1, threshold: float = None
+    ) -> List[Tuple[float, str, List[Any]]]:
+        """
+        The k names closest to this one, at least as similar as the threshold.
+
+        Returns (similarity, normalized name, values) tuples, most similar
+        first. The name itself is part of the result if it was added.
+        """
+        if threshold is None:
+            threshold = self.threshold
+
+        key = self.normalize(name)
+        grams = ngrams(key)
+
+        candidates = set()
+        for band, band_signature in self._bands(grams):
+            candidates.update(self._buckets[band].get(band_signature, ()))
+
+        scored = []
+        for candidate in candidates:
+            similarity = jaccard(grams, self.grams[candidate])
+            if similarity >= threshold:
+                scored.append((similarity, candidate))
+
+        # ties go to the shorter, then alphabetical name, so results are stable
+        best = heapq.nsmallest(
+            k, scored, key=lambda match: (-match[0], len(match[1]), match[1])
+        )
+        return [(similarity, key, self.values[key]) for similarity, key in best]
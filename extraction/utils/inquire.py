@@ -5,7 +5,11 @@ Utility script for probing into the fragment dataset
 import json
 import os
 import subprocess
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from sys import argv, stdout
+from typing import NamedTuple, Optional
 
 import pandas
 from pyecore.resources import ResourceSet
@@ -14,23 +18,233 @@ import pyecore.ecore as ecore
 
 
 from . import uml
+from .plant2uml import get_plantuml_uml, split_relationship
+from .zoo_archive import ZooArchive
 
-SOURCE_DIR = "C:\\Users\\songy\\Documents\\My Documents\\UDEM\\master thesis\\uml data\\database\\analysis\\"
-
-fragments_csv = os.path.join(SOURCE_DIR, "fragments.csv")
-labels_csv = os.path.join(SOURCE_DIR, "labels.csv")
-models_csv = os.path.join(SOURCE_DIR, "models.csv")
+# root of the dataset, override with the THREE_STEP_SOURCE_DIR environment variable
+SOURCE_DIR = os.environ.get(
+    "THREE_STEP_SOURCE_DIR",
+    "C:\\Users\\songy\\Documents\\My Documents\\UDEM\\master thesis\\uml data\\database\\analysis\\",
+)
 
-FRAGMENTS = pandas.read_csv(fragments_csv)
-LABELS = pandas.read_csv(labels_csv)
-MODELS = pandas.read_csv(models_csv)
+# column of models.csv holding the model name
+MODEL_NAME_COLUMN = "name"
 
 PLANTUML_PARSER = os.path.join(
-    SOURCE_DIR, "three-step", "extraction", "plantuml-parser.js"
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "plantuml-parser.js"
 )
 
+# the zoo packed by zoo_archive, read instead of the zoo files that did not
+# change since packing
+ZOO_ARCHIVE_NAME = "zoo.umlzoo"
+
 CURRENT_FRAGMENT = None
 
+# below this many ecore files to parse, a process pool costs more than it saves
+ECORE_POOL_THRESHOLD = 64
+
+# ecore files whose model is kept, the least recently read are dropped first
+ECORE_CACHE_SIZE = 4096
+
+# path -> (mtime, model) of the ecore files parsed, least recently read first,
+# copies are handed out
+_ECORE_CACHE: OrderedDict[str, tuple[int, Optional[uml.UML]]] = OrderedDict()
+_ECORE_CACHE_LOCK = threading.Lock()
+
+
+class Fragment(NamedTuple):
+    """
+    One row of fragments.csv
+    """
+
+    unique_id: int
+    model: str
+    kind: str
+    number: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.model}_{self.kind}{self.number}"
+
+
+class Dataset:
+    """
+    Lazily loaded view of the fragment dataset.
+
+    The csv files are only read on first access. Labels, fragments and models
+    are then indexed so that lookups by label id, fragment id or model name
+    are dictionary accesses instead of scans over the data frames.
+    """
+
+    def __init__(self, root: str = SOURCE_DIR) -> None:
+        self.root = root
+        self.zoo_dir = os.path.join(root, "zoo")
+        self.zoo_archive_path = os.path.join(root, ZOO_ARCHIVE_NAME)
+        # None until looked up, False when the zoo is not packed
+        self._zoo_archive = None
+
+        self._fragments: Optional[pandas.DataFrame] = None
+        self._labels: Optional[pandas.DataFrame] = None
+        self._models: Optional[pandas.DataFrame] = None
+
+        # label id -> fragment id
+        self._label_fragment: Optional[dict[int, int]] = None
+        # label id -> label text
+        self._label_text: Optional[dict[int, str]] = None
+        # fragment id -> fragment
+        self._fragment_index: Optional[dict[int, Fragment]] = None
+        # model name -> fragments, in csv order
+        self._model_fragments: Optional[dict[str, list[Fragment]]] = None
+        # model name -> label ids, in csv order
+        self._model_labels: Optional[dict[str, list[int]]] = None
+
+    # ------------------------------------------------------------------
+    # Raw data frames
+
+    @property
+    def fragments(self) -> pandas.DataFrame:
+        if self._fragments is None:
+            self._fragments = pandas.read_csv(
+                os.path.join(self.root, "fragments.csv")
+            )
+        return self._fragments
+
+    @property
+    def labels(self) -> pandas.DataFrame:
+        if self._labels is None:
+            self._labels = pandas.read_csv(os.path.join(self.root, "labels.csv"))
+        return self._labels
+
+    @property
+    def models(self) -> pandas.DataFrame:
+        """
+        models.csv indexed by the model name
+        """
+        if self._models is None:
+            self._models = pandas.read_csv(
+                os.path.join(self.root, "models.csv")
+            ).set_index(MODEL_NAME_COLUMN, drop=False)
+        return self._models
+
+    @property
+    def zoo_archive(self) -> Optional[ZooArchive]:
+        """
+        The packed zoo, None when there is none
+        """
+        if self._zoo_archive is None:
+            self._zoo_archive = False
+            if os.path.isfile(self.zoo_archive_path):
+                self._zoo_archive = ZooArchive(self.zoo_archive_path)
+        return self._zoo_archive or None
+
+    def zoo_model(self, file_name: str) -> Optional[uml.UML]:
+        """
+        The model of a zoo file from the packed zoo, None when the zoo is not
+        packed, the file is not in it or changed since it was packed
+        """
+        archive = self.zoo_archive
+        if archive is None or not archive.is_current(file_name, self.zoo_dir):
+            return None
+        return archive.read(file_name)
+
+    # ------------------------------------------------------------------
+    # Indexes
+
+    def _index_fragments(self):
+        if self._fragment_index is not None:
+            return
+
+        fragments = self.fragments
+        self._fragment_index = {}
+        self._model_fragments = {}
+        for fragment in zip(
+            fragments["unique_id"].tolist(),
+            fragments["model"].tolist(),
+            fragments["kind"].tolist(),
+            fragments["number"].tolist(),
+        ):
+            fragment = Fragment(*fragment)
+            self._fragment_index[fragment.unique_id] = fragment
+            self._model_fragments.setdefault(fragment.model, []).append(fragment)
+
+    def _index_labels(self):
+        if self._label_fragment is not None:
+            return
+
+        self._index_fragments()
+
+        labels = self.labels
+        label_ids = labels["id"].tolist()
+        fragment_ids = labels["fragment_id"].tolist()
+
+        self._label_fragment = dict(zip(label_ids, fragment_ids))
+        self._label_text = dict(zip(label_ids, labels["label"].tolist()))
+
+        self._model_labels = {}
+        for label_id, fragment_id in zip(label_ids, fragment_ids):
+            model_name = self._fragment_index[fragment_id].model
+            self._model_labels.setdefault(model_name, []).append(label_id)
+
+    # ------------------------------------------------------------------
+    # Lookups
+
+    def fragment(self, fragment_id: int) -> Fragment:
+        self._index_fragments()
+        return self._fragment_index[int(fragment_id)]
+
+    def label_fragment(self, label_id: int) -> Fragment:
+        """
+        The fragment that a label describes
+        """
+        self._index_labels()
+        return self._fragment_index[self._label_fragment[int(label_id)]]
+
+    def label_text(self, label_id: int) -> str:
+        self._index_labels()
+        return self._label_text[int(label_id)]
+
+    def label_ids(self) -> list[int]:
+        self._index_labels()
+        return list(self._label_fragment.keys())
+
+    def model_fragments(self, model_name: str) -> list[Fragment]:
+        self._index_fragments()
+        return self._model_fragments.get(model_name, [])
+
+    def model_labels(self, model_name: str) -> list[int]:
+        self._index_labels()
+        return self._model_labels.get(model_name, [])
+
+    def model(self, model_name: str) -> pandas.Series:
+        """
+        The row of models.csv for this model
+        """
+        return self.models.loc[model_name]
+
+
+DATASET = Dataset()
+
+
+def set_source_dir(source_dir: str):
+    """
+    Points the module to another copy of the dataset
+    """
+    global SOURCE_DIR, DATASET
+    SOURCE_DIR = source_dir
+    DATASET = Dataset(source_dir)
+    return DATASET
+
+
+def __getattr__(name: str):
+    # the data frames used to be loaded at import, keep them reachable lazily
+    if name == "FRAGMENTS":
+        return DATASET.fragments
+    if name == "LABELS":
+        return DATASET.labels
+    if name == "MODELS":
+        return DATASET.models
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 class PlantUMLSwitch(object):
     def __init__(self):
@@ -114,82 +328,160 @@ class PlantUMLSwitch(object):
 
 def get_ecore_uml_fragment(label_id: int):
     # Get fragment unique id
-    label = LABELS.loc[LABELS["id"] == label_id]
-    fragment_id = label["fragment_id"].values[0]
-
-    fragment = FRAGMENTS.loc[FRAGMENTS["unique_id"] == fragment_id]
+    fragment = DATASET.label_fragment(label_id)
 
     global CURRENT_FRAGMENT
 
-    fragment_name = "{}_{}{}.ecore".format(
-        fragment["model"].values[0],
-        fragment["kind"].values[0],
-        fragment["number"].values[0],
-    )
+    fragment_name = fragment.name + ".ecore"
 
     CURRENT_FRAGMENT = fragment_name
 
-    # UML Ecore
-    rset = ResourceSet()
-    metamodel_resource = rset.get_resource(
-        os.path.join(SOURCE_DIR, "zoo", fragment_name)
-    )
-    root = metamodel_resource.contents[0]
-    switch = PlantUMLSwitch()
-    switch.generate(root)
-    switch.completion()
+    model = DATASET.zoo_model(fragment_name)
+    if model is None:
+        model = read_ecore_uml(os.path.join(DATASET.zoo_dir, fragment_name))
+
+    return _ecore_fragment(fragment, model)
+
 
-    if fragment["kind"].values[0] == "class":
-        switch.result.classes[0].kind = "class"
+def get_ecore_uml_fragments(label_ids: list[int], max_workers: Optional[int] = None):
+    """
+    Batch version of get_ecore_uml_fragment.
 
-    if switch.result is None:
+    The fragments that are not in the packed zoo are read in one bulk
+    read_ecore_umls.
+    """
+    fragments = [DATASET.label_fragment(label_id) for label_id in label_ids]
+    file_names = [fragment.name + ".ecore" for fragment in fragments]
+    models = [DATASET.zoo_model(file_name) for file_name in file_names]
+
+    # not in the packed zoo
+    paths = [
+        os.path.join(DATASET.zoo_dir, file_name)
+        for file_name, model in zip(file_names, models)
+        if model is None
+    ]
+    loaded = iter(read_ecore_umls(paths, max_workers))
+    models = [next(loaded) if model is None else model for model in models]
+
+    return [
+        _ecore_fragment(fragment, model) for fragment, model in zip(fragments, models)
+    ]
+
+
+def _ecore_fragment(fragment: Fragment, model: Optional[uml.UML]) -> uml.UML:
+    if model is None:
         raise Exception("No original fragment!!")
-    return switch.result
+
+    if fragment.kind == "class":
+        model.classes[0].kind = "class"
+
+    return model
 
 
 def get_json_uml_int(label_id: int):
     # Get fragment unique id
-    label = LABELS.loc[LABELS["id"] == label_id]
-    fragment_id = label["fragment_id"].values[0]
-
-    fragment = FRAGMENTS.loc[FRAGMENTS["unique_id"] == fragment_id]
+    fragment = DATASET.label_fragment(label_id)
 
     global CURRENT_FRAGMENT
 
-    fragment_name = "{}_{}{}.json".format(
-        fragment["model"].values[0],
-        fragment["kind"].values[0],
-        fragment["number"].values[0],
-    )
+    fragment_name = fragment.name + ".json"
 
     CURRENT_FRAGMENT = fragment_name
 
-    json_file = os.path.join(SOURCE_DIR, "zoo", fragment_name)
-    if not os.path.isfile(json_file):
-        # parse the plantuml with the node package
-        exit_code = subprocess.call(
-            args=[
-                "node",
-                PLANTUML_PARSER,
-                json_file.removesuffix(".json") + ".plantuml",
-            ]
-        )
+    model = DATASET.zoo_model(fragment_name)
+    if model is not None:
+        return model
 
-        if exit_code != 0:
-            raise Warning("Did not generate json properly: {}", json_file)
+    json_file = os.path.join(DATASET.zoo_dir, fragment_name)
+    convert_missing_json([json_file.removesuffix(".json") + ".plantuml"])
 
     return get_json_uml(json_file)
 
 
+def get_json_uml_ints(label_ids: list[int]):
+    """
+    Batch version of get_json_uml_int.
+
+    Missing json files are all generated by a single node process.
+    """
+    file_names = [
+        DATASET.label_fragment(label_id).name + ".json" for label_id in label_ids
+    ]
+    models = [DATASET.zoo_model(file_name) for file_name in file_names]
+
+    # not in the packed zoo
+    json_files = [
+        os.path.join(DATASET.zoo_dir, file_name)
+        for file_name, model in zip(file_names, models)
+        if model is None
+    ]
+    convert_missing_json([f.removesuffix(".json") + ".plantuml" for f in json_files])
+
+    loaded = iter(load_many(json_files))
+    return [next(loaded) if model is None else model for model in models]
+
+
+# files given to one node invocation, keeps the command line short enough for Windows
+NODE_BATCH_SIZE = 200
+
+
+def convert_missing_json(plantuml_files: list[str]):
+    """
+    Parses the plantuml files that have no json yet with the node package.
+
+    All the conversions happen in as few node processes as possible.
+    """
+    missing = [
+        plantuml_file
+        for plantuml_file in dict.fromkeys(plantuml_files)
+        if not os.path.isfile(plantuml_file.removesuffix(".plantuml") + ".json")
+    ]
+
+    for start in range(0, len(missing), NODE_BATCH_SIZE):
+        batch = missing[start : start + NODE_BATCH_SIZE]
+        exit_code = subprocess.call(args=["node", PLANTUML_PARSER, *batch])
+
+        if exit_code != 0:
+            raise Warning("Did not generate json properly: {}".format(batch))
+
+
+def get_plantuml_uml_int(label_id: int):
+    """
+    Reads the fragment's PlantUML in process, no node or json involved
+    """
+    fragment = DATASET.label_fragment(label_id)
+
+    global CURRENT_FRAGMENT
+
+    fragment_name = fragment.name + ".plantuml"
+
+    CURRENT_FRAGMENT = fragment_name
+
+    model = DATASET.zoo_model(fragment_name)
+    if model is not None:
+        return model
+
+    return get_plantuml_uml(os.path.join(DATASET.zoo_dir, fragment_name))
+
+
 def get_ecore_uml_model(name: str):
     """
     Builds the model from the ecore uml
     """
+    model = DATASET.zoo_model(name + ".ecore")
+    if model is not None:
+        return model
+
+    return read_ecore_uml(os.path.join(DATASET.zoo_dir, name + ".ecore"))
+
+
+def load_ecore_uml(path: str) -> Optional[uml.UML]:
+    """
+    Reads an ecore file into a uml model, all its classes of kind "rel"
+    """
     # UML Ecore
     rset = ResourceSet()
-    metamodel_resource = rset.get_resource(
-        os.path.join(SOURCE_DIR, "zoo", name + ".ecore")
-    )
+    metamodel_resource = rset.get_resource(path)
     root = metamodel_resource.contents[0]
     switch = PlantUMLSwitch()
     switch.generate(root)
@@ -198,122 +490,107 @@ def get_ecore_uml_model(name: str):
     return switch.result
 
 
-def get_uml_fragment_name(label_id: int):
-    # Get fragment unique id
-    label = LABELS.loc[LABELS["id"] == int(label_id)]
-    fragment_id = label["fragment_id"].values[0]
-
-    fragment = FRAGMENTS.loc[FRAGMENTS["unique_id"] == fragment_id]
-
-    fragment_name = "{}_{}{}".format(
-        fragment["model"].values[0],
-        fragment["kind"].values[0],
-        fragment["number"].values[0],
-    )
-    return fragment_name
-
-
-def get_json_uml(filename: str):
-    with open(filename, "r") as json_path:
-        json_object = json.load(json_path)
-
-    # has a package
-    if "type" in json_object["elements"][0]:
-        pass
-    else:
-        # is a fragment
-        return get_json_uml_fragment(filename)
+def _copy(model: Optional[uml.UML]) -> Optional[uml.UML]:
+    return None if model is None else model.copy()
 
-    # plantuml-parser syntax
-    # get the uml package
-    package_level = json_object["elements"][0]
 
-    package_name = package_level["name"]
+def read_ecore_uml(path: str) -> Optional[uml.UML]:
+    """
+    load_ecore_uml, memoized by path and modification time.
 
-    # uml
-    model_read = uml.UML(package_name)
+    The model is a copy, callers can change it.
+    """
+    return read_ecore_umls([path])[0]
 
-    package_elements = package_level["elements"]
 
-    package_relations = []
+def read_ecore_umls(
+    paths: list[str], max_workers: Optional[int] = None
+) -> list[Optional[uml.UML]]:
+    """
+    Batch version of read_ecore_uml.
 
-    for element in package_elements:
-        if "name" in element:
-            # this is a class
-            class_fragment = uml.UMLClass(element["name"], "class")
+    The files not in the cache, or changed since, are parsed in a process
+    pool when there are enough of them. Results are in the order of the
+    paths.
+    """
+    paths = [os.path.abspath(path) for path in paths]
+    mtimes = {path: os.stat(path).st_mtime_ns for path in paths}
+
+    # path -> model, of the files whose cached model is up to date
+    cached = {}
+    with _ECORE_CACHE_LOCK:
+        for path, mtime in mtimes.items():
+            entry = _ECORE_CACHE.get(path)
+            if entry is not None and entry[0] == mtime:
+                cached[path] = entry[1]
+                _ECORE_CACHE.move_to_end(path)
+    stale = [path for path in mtimes if path not in cached]
+
+    if len(stale) < ECORE_POOL_THRESHOLD:
+        loaded = [load_ecore_uml(path) for path in stale]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            loaded = list(executor.map(load_ecore_uml, stale, chunksize=32))
 
-            # attributes
-            if len(element["members"]) != 0:
-                for member in element["members"]:
-                    class_fragment.attribute(member["name"], member["type"])
+    with _ECORE_CACHE_LOCK:
+        for path, model in zip(stale, loaded):
+            _ECORE_CACHE[path] = (mtimes[path], model)
+            _ECORE_CACHE.move_to_end(path)
+            cached[path] = model
+        while len(_ECORE_CACHE) > ECORE_CACHE_SIZE:
+            _ECORE_CACHE.popitem(last=False)
 
-            model_read.classes.append(class_fragment)
+    return [_copy(cached[path]) for path in paths]
 
-        else:
-            # this is a relationship
-            package_relations.append(element)
 
-    for relation in package_relations:
-        # zoo format
+def clear_ecore_cache():
+    with _ECORE_CACHE_LOCK:
+        _ECORE_CACHE.clear()
 
-        # source class
-        try:
-            source_class = [
-                eclass
-                for eclass in model_read.classes
-                if eclass.name == relation["left"]
-            ].pop()
-        except IndexError:
-            # create the class
-            source_class = uml.UMLClass(relation["left"], "class")
-            model_read.classes.append(source_class)
 
-        # destination class
-        try:
-            dest_class = [
-                eclass
-                for eclass in model_read.classes
-                if eclass.name == relation["right"]
-            ].pop()
-        except IndexError:
-            # create the class
-            dest_class = uml.UMLClass(relation["right"], "class")
-            model_read.classes.append(dest_class)
+def get_uml_fragment_name(label_id: int):
+    return DATASET.label_fragment(label_id).name
 
-        # cardinality and name
-        split_cardinality: list[str] = relation["leftCardinality"].split()
-        if relation["leftCardinality"] == "":
-            cardinality, name = "", ""
 
-        elif len(split_cardinality) == 1:
-            if split_cardinality[0].isalpha():
-                cardinality = ""
-                name = split_cardinality[0]
-            else:
-                cardinality = split_cardinality[0]
-                name = ""
+def get_json_uml(filename: str):
+    """
+    Reads the json written by the node plantuml-parser, packaged or not
+    """
+    return load_json_uml(filename)
 
-        elif len(split_cardinality) != 2:
-            raise Warning(
-                "Unexpected cardinality, {}".format(relation["leftCardinality"])
-            )
-        else:
-            name, cardinality = split_cardinality
 
-        source_class.association(dest_class, cardinality, name)
+def get_json_uml_fragment(json_file: str):
+    """
+    Reads the json of a fragment, named after its file
+    """
+    return load_json_uml(json_file)
 
-    return model_read
 
+def load_json_uml(filename: str) -> uml.UML:
+    """
+    Single pass reader for the plantuml-parser json.
 
-def get_json_uml_fragment(json_file: str):
-    with open(json_file, "r") as json_path:
+    A model with a package is named after the package. A fragment, without
+    package, is named after its file.
+    """
+    with open(filename, "r") as json_path:
         json_object = json.load(json_path)
 
-    model_read = uml.UML(os.path.basename(json_file).removesuffix(".json"))
+    # has a package
+    if "type" in json_object["elements"][0]:
+        # plantuml-parser syntax
+        # get the uml package
+        package_level = json_object["elements"][0]
+        model_read = uml.UML(package_level["name"])
+        package_elements = package_level["elements"]
 
-    # plantuml-parser syntax
-    # get the uml package
-    package_elements = json_object["elements"]
+    # is a fragment
+    else:
+        model_read = uml.UML(os.path.basename(filename).removesuffix(".json"))
+        package_elements = json_object["elements"]
+
+    # name -> class, the last class of a name wins
+    classes_by_name: dict[str, uml.UMLClass] = {}
 
     package_relations = []
 
@@ -323,11 +600,11 @@ def get_json_uml_fragment(json_file: str):
             class_fragment = uml.UMLClass(element["name"], "class")
 
             # attributes
-            if len(element["members"]) != 0:
-                for member in element["members"]:
-                    class_fragment.attribute(member["name"], member["type"])
+            for member in element["members"]:
+                class_fragment.attribute(member["name"], member["type"])
 
             model_read.classes.append(class_fragment)
+            classes_by_name[class_fragment.name] = class_fragment
 
         else:
             # this is a relationship
@@ -337,54 +614,43 @@ def get_json_uml_fragment(json_file: str):
         # zoo format
 
         # source class
-        try:
-            source_class = [
-                eclass
-                for eclass in model_read.classes
-                if eclass.name == relation["left"]
-            ].pop()
-        except IndexError:
+        source_class = classes_by_name.get(relation["left"])
+        if source_class is None:
             # create the class
             source_class = uml.UMLClass(relation["left"], "class")
             model_read.classes.append(source_class)
+            classes_by_name[source_class.name] = source_class
 
         # destination class
-        try:
-            dest_class = [
-                eclass
-                for eclass in model_read.classes
-                if eclass.name == relation["right"]
-            ].pop()
-        except IndexError:
+        dest_class = classes_by_name.get(relation["right"])
+        if dest_class is None:
             # create the class
             dest_class = uml.UMLClass(relation["right"], "class")
             model_read.classes.append(dest_class)
+            classes_by_name[dest_class.name] = dest_class
 
-        # cardinality and name
-        split_cardinality: list[str] = relation["leftCardinality"].split()
-        if relation["leftCardinality"] == "":
-            cardinality, name = "", ""
-
-        elif len(split_cardinality) == 1:
-            if split_cardinality[0].isalpha():
-                cardinality = ""
-                name = split_cardinality[0]
-            else:
-                cardinality = split_cardinality[0]
-                name = ""
-
-        elif len(split_cardinality) != 2:
-            raise Warning(
-                "Unexpected cardinality, {}".format(relation["leftCardinality"])
-            )
-        else:
-            name, cardinality = split_cardinality
+        # cardinality and name, read like the native parser reads them
+        cardinality, name = split_relationship(
+            relation["leftCardinality"],
+            relation.get("rightCardinality", ""),
+            relation.get("label", ""),
+        )
 
         source_class.association(dest_class, cardinality, name)
 
     return model_read
 
 
+def load_many(paths: list[str], max_workers: Optional[int] = None) -> list[uml.UML]:
+    """
+    Reads many json files, the file reads are spread over a thread pool.
+
+    Results are in the order of the paths.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(load_json_uml, paths))
+
+
 if __name__ == "__main__":
 
     # model = get_json_uml("temp/cfg/CFG.json")
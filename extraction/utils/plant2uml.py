@@ -0,0 +1,307 @@
+"""
+Reads PlantUML class diagrams straight into uml.UML, without going through
+the node plantuml-parser and its json output.
+
+Supported subset, which covers what uml.UML._to_plantuml writes and what the
+model zoo contains:
+- packages (flattened into one model)
+- classes, abstract classes, interfaces and enums, with a body on the same
+  line as the declaration or on the following lines
+- members, "name : type" or "name"
+- relationships with cardinalities and labels
+
+Relationships are read like inquire.get_json_uml reads the parser's json:
+they go from the left class to the right class, and the left cardinality
+holds the name and the multiplicity ("name 0..*").
+"""
+
+import os
+import re
+from typing import Optional, Tuple
+
+from . import uml
+
+CLASS_DECLARATION = re.compile(
+    r"^(?P<kind>abstract\s+class|abstract|class|interface|enum|entity)\s+"
+    r'(?P<name>"[^"]+"|[\w.$]+)(?P<rest>.*)$'
+)
+
+PACKAGE_DECLARATION = re.compile(
+    r'^(?:package|namespace)\s+(?P<name>"[^"]+"|[\w.$]+)(?P<rest>.*)$'
+)
+
+RELATIONSHIP = re.compile(
+    r'^(?P<left>"[^"]+"|[\w.$]+)\s*'
+    r'(?:"(?P<left_cardinality>[^"]*)"\s*)?'
+    r"(?P<arrow>[<|*o#x}+^]{0,2}[-.]+"
+    r"(?:(?:\[[^\]]*\]|up|down|left|right|u|d|l|r)[-.]+)?"
+    r"[>|*o#x{+^]{0,2})\s*"
+    r'(?:"(?P<right_cardinality>[^"]*)"\s*)?'
+    r'(?P<right>"[^"]+"|[\w.$]+)\s*'
+    r"(?::\s*(?P<label>.*))?$"
+)
+
+# lines that do not describe the model
+IGNORED_PREFIXES = (
+    "@startuml",
+    "@enduml",
+    "!",
+    "'",
+    "hide ",
+    "show ",
+    "skinparam ",
+    "title ",
+    "left to right",
+    "top to bottom",
+    "scale ",
+)
+
+# separators inside a class body
+BODY_SEPARATORS = ("--", "..", "==", "__")
+
+
+def split_cardinality(label: str) -> Tuple[str, str]:
+    """
+    Splits the "name multiplicity" label of a relationship end.
+
+    Returns (multiplicity, name)
+    """
+    split_label = label.split()
+    if label == "":
+        return "", ""
+
+    elif len(split_label) == 1:
+        if split_label[0].isalpha():
+            return "", split_label[0]
+        else:
+            return split_label[0], ""
+
+    elif len(split_label) != 2:
+        raise Warning("Unexpected cardinality, {}".format(label))
+
+    name, cardinality = split_label
+    return cardinality, name
+
+
+def _unquote(name: str) -> str:
+    if len(name) > 1 and name[0] == '"' and name[-1] == '"':
+        return name[1:-1]
+    return name
+
+
+def _read_member(line: str) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Returns (name, type) of a member line or None if it is not an attribute
+    """
+    # methods are not part of our uml
+    if "(" in line:
+        return None
+
+    # modifiers and visibility
+    line = re.sub(r"\{(static|abstract|classifier|field)\}", "", line).strip()
+    if line[:1] in "+-#~" and len(line) > 1:
+        line = line[1:].strip()
+
+    if line == "":
+        return None
+
+    if ":" in line:
+        name, attribute_type = line.split(":", 1)
+        name = name.strip()
+        attribute_type = attribute_type.strip()
+        return name, attribute_type if attribute_type != "" else None
+
+    return line, None
+
+
+def split_relationship(
+    left_cardinality: str, right_cardinality: str, label: str
+) -> Tuple[str, str]:
+    """
+    Returns (multiplicity, name) of a relationship from the cardinalities of
+    its ends and its label, the same for the native parser and the
+    plantuml-parser json
+    """
+    multiplicity, name = split_cardinality(left_cardinality)
+
+    # written by uml.UMLClass: A "1" --> "*" B : name, ranges at both ends are
+    # two multiplicities, the one of the source is kept
+    split_right = right_cardinality.split()
+    if (
+        multiplicity != ""
+        and name == ""
+        and len(split_right) == 1
+        and not split_right[0].isalpha()
+        and ".." not in multiplicity
+        and ".." not in split_right[0]
+    ):
+        multiplicity = f"{multiplicity}..{split_right[0]}"
+
+    if name == "" and label:
+        name = label.strip()
+
+    return multiplicity, name
+
+
+def parse_plantuml(text: str, default_name: str = "") -> uml.UML:
+    """
+    Builds the uml from PlantUML text.
+
+    The model is named after the first package, or default_name if the
+    diagram has no package.
+    """
+    package_name = None
+    classes: list[uml.UMLClass] = []
+    # source name, dest name, multiplicity, name
+    relations: list[Tuple[str, str, str, str]] = []
+
+    current_class: Optional[uml.UMLClass] = None
+    in_body = False
+    # class declared without a body yet, it may open on the next line
+    awaiting_body: Optional[uml.UMLClass] = None
+    # blocks that are skipped entirely, like notes
+    skipped_block_end: Optional[str] = None
+    skipped_depth = 0
+    in_comment = False
+
+    for line in text.splitlines():
+        line = line.strip()
+
+        # block comments
+        if in_comment:
+            if "'/" in line:
+                in_comment = False
+            continue
+        if line.startswith("/'"):
+            in_comment = "'/" not in line[2:]
+            continue
+
+        if line == "":
+            continue
+
+        # notes and other skipped blocks
+        if skipped_block_end is not None:
+            if skipped_block_end == "}":
+                skipped_depth += line.count("{") - line.count("}")
+                if skipped_depth <= 0:
+                    skipped_block_end = None
+            elif line.startswith(skipped_block_end):
+                skipped_block_end = None
+            continue
+
+        # class body
+        if in_body:
+            if line.startswith("}"):
+                in_body = False
+                current_class = None
+                continue
+            if line.startswith(BODY_SEPARATORS):
+                continue
+            member = _read_member(line)
+            if member is not None:
+                current_class.attribute(*member)
+            continue
+
+        if awaiting_body is not None:
+            current_class = awaiting_body
+            awaiting_body = None
+            if line == "{":
+                in_body = True
+                continue
+            if line == "{}":
+                continue
+
+        if line.startswith(IGNORED_PREFIXES):
+            continue
+
+        if line.startswith("note ") and ":" not in line:
+            skipped_block_end = "end note"
+            continue
+
+        if line.startswith(("skinparam", "together")) and line.endswith("{"):
+            skipped_block_end = "}"
+            skipped_depth = 1
+            continue
+
+        # end of a package
+        if line == "}":
+            continue
+
+        match = PACKAGE_DECLARATION.match(line)
+        if match is not None:
+            if package_name is None:
+                package_name = _unquote(match.group("name"))
+            continue
+
+        match = CLASS_DECLARATION.match(line)
+        if match is not None:
+            uml_class = uml.UMLClass(_unquote(match.group("name")), "class")
+            classes.append(uml_class)
+
+            rest = match.group("rest").strip()
+            if rest.endswith("{"):
+                current_class = uml_class
+                in_body = True
+            elif rest.endswith("}") and "{" in rest:
+                # one line body
+                current_class = uml_class
+                body = rest[rest.rindex("{", 0, rest.rindex("}")) + 1 : -1]
+                for member_line in body.split(";"):
+                    member = _read_member(member_line.strip())
+                    if member is not None:
+                        uml_class.attribute(*member)
+                current_class = None
+            else:
+                awaiting_body = uml_class
+            continue
+
+        match = RELATIONSHIP.match(line)
+        if match is not None:
+            multiplicity, name = split_relationship(
+                match.group("left_cardinality") or "",
+                match.group("right_cardinality") or "",
+                match.group("label") or "",
+            )
+            relations.append(
+                (
+                    _unquote(match.group("left")),
+                    _unquote(match.group("right")),
+                    multiplicity,
+                    name,
+                )
+            )
+            continue
+
+    model = uml.UML(package_name if package_name is not None else default_name)
+    model.classes = classes
+
+    # last declaration wins, like the json reader
+    classes_by_name = {uml_class.name: uml_class for uml_class in classes}
+
+    for source_name, dest_name, multiplicity, name in relations:
+        source_class = classes_by_name.get(source_name)
+        if source_class is None:
+            source_class = uml.UMLClass(source_name, "class")
+            model.classes.append(source_class)
+            classes_by_name[source_name] = source_class
+
+        dest_class = classes_by_name.get(dest_name)
+        if dest_class is None:
+            dest_class = uml.UMLClass(dest_name, "class")
+            model.classes.append(dest_class)
+            classes_by_name[dest_name] = dest_class
+
+        source_class.association(dest_class, multiplicity, name)
+
+    return model
+
+
+def get_plantuml_uml(filename: str) -> uml.UML:
+    """
+    Reads a .plantuml file. Fragments without a package are named after the file.
+    """
+    with open(filename, "r") as plantuml_file:
+        text = plantuml_file.read()
+
+    default_name = os.path.splitext(os.path.basename(filename))[0]
+    return parse_plantuml(text, default_name)
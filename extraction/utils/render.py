@@ -0,0 +1,301 @@
+"""
+Renders PlantUML diagrams with one Java process.
+
+Starting the JVM costs far more than rendering a fragment, so
+PlantUMLRenderer keeps one "java -jar plantuml.jar -pipe" alive and streams
+every diagram through it. Files already saved, e.g. by UML.save, are
+rendered by render_files in one invocation per batch.
+
+The jar is read from the PLANTUML_JAR environment variable, which is
+required, java from JAVA.
+"""
+
+import atexit
+import os
+import queue
+import re
+import subprocess
+import threading
+import uuid
+from typing import Iterable, List, Optional, Union
+
+from . import uml
+
+PLANTUML_JAR = os.environ.get("PLANTUML_JAR")
+JAVA = os.environ.get("JAVA", "java")
+
+# files given to one java invocation, keeps the command line short enough for Windows
+RENDER_BATCH_SIZE = 200
+
+READ_SIZE = 1 << 16
+
+# seconds to wait for an image before PlantUML is stopped, restarted by the next
+# render
+READ_TIMEOUT = 60
+
+# lines opening and closing a diagram, PlantUML renders one image per pair
+DIAGRAM_START = re.compile(r"^\s*@start[a-z]*\b", re.MULTILINE)
+DIAGRAM_END = re.compile(r"^\s*@end[a-z]*\b", re.MULTILINE)
+
+Diagram = Union[str, uml.UML]
+
+
+def diagram_text(diagram: Diagram) -> str:
+    """
+    The PlantUML of a diagram, text or uml model
+    """
+    if isinstance(diagram, uml.UML):
+        return diagram.to_string()
+    return diagram
+
+
+def check_diagram_text(text: str):
+    """
+    Raises unless the text is exactly one diagram, one @startuml and one
+    @enduml after it. Anything else gives no image or several, and the
+    images read after it would belong to other diagrams.
+    """
+    starts = [match.start() for match in DIAGRAM_START.finditer(text)]
+    ends = [match.start() for match in DIAGRAM_END.finditer(text)]
+    if len(starts) != 1 or len(ends) != 1 or ends[0] < starts[0]:
+        raise Exception(
+            "Not one @startuml ... @enduml diagram: {}".format(text[:80])
+        )
+
+
+def check_jar(jar: Optional[str]):
+    if jar is None:
+        raise Exception("Set PLANTUML_JAR to the path of plantuml.jar")
+    if not os.path.isfile(jar):
+        raise Exception("PlantUML jar not found: {}, set PLANTUML_JAR".format(jar))
+
+
+class PlantUMLRenderer:
+    """
+    One PlantUML process in pipe mode, rendering diagrams in order.
+
+    Diagrams are PlantUML text or uml models. Safe to share between
+    threads, renders are serialized. A process that gives no image within
+    timeout seconds is stopped, the next render starts a new one.
+    """
+
+    def __init__(
+        self,
+        output_format: str = "png",
+        jar: str = None,
+        java: str = None,
+        timeout: float = READ_TIMEOUT,
+    ) -> None:
+        self.output_format = output_format
+        self.jar = jar or PLANTUML_JAR
+        self.java = java or JAVA
+        self.timeout = timeout
+        # written by PlantUML after every image, unlikely in an image
+        self.delimiter = f"__PLANTUML_END_{uuid.uuid4().hex}__".encode()
+
+        self._process: Optional[subprocess.Popen] = None
+        # output of the process, read by its own thread
+        self._chunks: Optional[queue.Queue] = None
+        self._pending = b""
+        self._lock = threading.Lock()
+
+    def _start(self):
+        if self._process is not None and self._process.poll() is None:
+            return
+
+        check_jar(self.jar)
+
+        self._pending = b""
+        self._process = subprocess.Popen(
+            [
+                self.java,
+                "-Djava.awt.headless=true",
+                "-jar",
+                self.jar,
+                "-pipe",
+                "-t" + self.output_format,
+                "-charset",
+                "UTF-8",
+                "-pipedelimitor",
+                self.delimiter.decode(),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._chunks = queue.Queue()
+        threading.Thread(
+            target=self._read, args=(self._process, self._chunks), daemon=True
+        ).start()
+
+    @staticmethod
+    def _read(process: subprocess.Popen, chunks: queue.Queue):
+        # until the process ends, an empty chunk tells the end
+        stdout = process.stdout.fileno()
+        try:
+            while True:
+                try:
+                    chunk = os.read(stdout, READ_SIZE)
+                except OSError:
+                    chunk = b""
+                chunks.put(chunk)
+                if chunk == b"":
+                    return
+        finally:
+            process.stdout.close()
+
+    def _write(self, process: subprocess.Popen, texts: List[str]):
+        try:
+            for text in texts:
+                if not text.endswith("\n"):
+                    text += "\n"
+                process.stdin.write(text.encode("utf-8"))
+            process.stdin.flush()
+        except (OSError, ValueError):
+            # the reader reports the dead process
+            pass
+
+    def _read_image(self) -> bytes:
+        while True:
+            end = self._pending.find(self.delimiter)
+            if end != -1:
+                image = self._pending[:end]
+                self._pending = self._pending[end + len(self.delimiter) :]
+                # the delimiter is printed on its own line
+                return image.lstrip(b"\r\n")
+
+            try:
+                chunk = self._chunks.get(timeout=self.timeout)
+            except queue.Empty:
+                self.close(kill=True)
+                raise Exception(
+                    "PlantUML gave no image in {} s, stopped".format(self.timeout)
+                )
+            if chunk == b"":
+                self.close()
+                raise Exception("PlantUML stopped while rendering")
+            self._pending += chunk
+
+    def render(self, diagram: Diagram) -> bytes:
+        """
+        The image of one diagram
+        """
+        return self.render_many([diagram])[0]
+
+    def render_many(self, diagrams: Iterable[Diagram]) -> List[bytes]:
+        """
+        The images of many diagrams, in order.
+
+        The diagrams are written while the images are read, so PlantUML never
+        waits for the next diagram. Every diagram is checked before any is
+        written.
+        """
+        texts = [diagram_text(diagram) for diagram in diagrams]
+        if len(texts) == 0:
+            return []
+        for text in texts:
+            check_diagram_text(text)
+
+        with self._lock:
+            self._start()
+            writer = threading.Thread(
+                target=self._write, args=(self._process, texts)
+            )
+            writer.start()
+            try:
+                return [self._read_image() for _ in texts]
+            finally:
+                writer.join()
+
+    def render_to(self, diagram: Diagram, path: str) -> str:
+        """
+        Renders a diagram to an image file
+        """
+        image = self.render(diagram)
+        with open(path, "wb") as image_file:
+            image_file.write(image)
+        return path
+
+    def close(self, kill: bool = False):
+        if self._process is None:
+            return
+        process, self._process = self._process, None
+        if kill:
+            process.kill()
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def __enter__(self) -> "PlantUMLRenderer":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+
+# output format -> renderer shared by the module functions
+_RENDERERS: dict[str, PlantUMLRenderer] = {}
+_RENDERERS_LOCK = threading.Lock()
+
+
+def get_renderer(output_format: str = "png") -> PlantUMLRenderer:
+    """
+    The shared renderer of a format, its process lives until exit
+    """
+    with _RENDERERS_LOCK:
+        renderer = _RENDERERS.get(output_format)
+        if renderer is None:
+            renderer = _RENDERERS[output_format] = PlantUMLRenderer(output_format)
+        return renderer
+
+
+@atexit.register
+def close_renderers():
+    with _RENDERERS_LOCK:
+        for renderer in _RENDERERS.values():
+            renderer.close()
+        _RENDERERS.clear()
+
+
+def render(diagram: Diagram, output_format: str = "png") -> bytes:
+    """
+    The image of a diagram, through the shared renderer
+    """
+    return get_renderer(output_format).render(diagram)
+
+
+def render_files(
+    paths: List[str],
+    output_format: str = "png",
+    output_dir: str = None,
+    jar: str = None,
+    java: str = None,
+):
+    """
+    Renders saved .plantuml files, one JVM per batch of files.
+
+    Images are written next to the files, or in output_dir.
+    """
+    jar = jar or PLANTUML_JAR
+    check_jar(jar)
+
+    options = ["-t" + output_format, "-charset", "UTF-8"]
+    if output_dir is not None:
+        options += ["-o", os.path.abspath(output_dir)]
+
+    for start in range(0, len(paths), RENDER_BATCH_SIZE):
+        batch = paths[start : start + RENDER_BATCH_SIZE]
+        exit_code = subprocess.call(
+            args=[java or JAVA, "-Djava.awt.headless=true", "-jar", jar]
+            + options
+            + batch
+        )
+
+        if exit_code != 0:
+            raise Warning("Did not render properly: {}".format(batch))
@@ -0,0 +1,233 @@
+"""
+Content addressed cache of rendered diagrams.
+
+Images are stored under a hash of the PlantUML text and the output format,
+so a diagram is rendered again only when its PlantUML changes. The same
+fragment across runs, or an unchanged model in a nightly batch, is read
+back from the cache.
+
+The cache is a directory bounded in size, the least recently used images
+are evicted first. Several processes can share it, images are written
+through a temporary file renamed into place.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional
+
+from .render import Diagram, diagram_text, get_renderer
+
+# where the images are kept, override with the PLANTUML_CACHE_DIR variable
+RENDER_CACHE_DIR = os.environ.get(
+    "PLANTUML_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "plantuml-renders"),
+)
+
+# size of the images kept, in bytes
+MAX_BYTES = 256 * 1024 * 1024
+
+
+def diagram_key(diagram: Diagram, output_format: str = "png") -> str:
+    """
+    The cache key of a diagram, a hash of its PlantUML and the format
+    """
+    digest = hashlib.blake2b(diagram_text(diagram).encode("utf-8"), digest_size=16)
+    digest.update(output_format.encode())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    Rendered images by PlantUML text, least recently used evicted first.
+
+    Misses are rendered by the shared renderer of the format, see
+    get_renderer.
+    """
+
+    def __init__(
+        self,
+        directory: str = RENDER_CACHE_DIR,
+        max_bytes: int = MAX_BYTES,
+        renderer_factory=get_renderer,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.renderer_factory = renderer_factory
+
+        # file name -> size, least recently used first
+        self._entries: Optional[OrderedDict[str, int]] = None
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _file_name(self, key: str, output_format: str) -> str:
+        return f"{key}.{output_format}"
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.directory, file_name)
+
+    def _load(self):
+        if self._entries is not None:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # recency of earlier runs, from the modification times
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                found.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        found.sort()
+
+        self._entries = OrderedDict((name, size) for _, name, size in found)
+        self._size = sum(self._entries.values())
+
+    def _evict(self):
+        # the image just stored stays, even larger than the bound
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            file_name, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(file_name))
+            except FileNotFoundError:
+                # evicted by another process
+                pass
+
+    def get(self, diagram: Diagram, output_format: str = "png") -> Optional[bytes]:
+        """
+        The cached image of a diagram, None when not cached
+        """
+        key = diagram_key(diagram, output_format)
+        file_name = self._file_name(key, output_format)
+        with self._lock:
+            self._load()
+            if file_name not in self._entries:
+                return None
+
+            path = self._path(file_name)
+            try:
+                with open(path, "rb") as image_file:
+                    image = image_file.read()
+                # recency for the next runs
+                os.utime(path)
+            except FileNotFoundError:
+                # evicted by another process
+                self._size -= self._entries.pop(file_name)
+                return None
+
+            self._entries.move_to_end(file_name)
+            return image
+
+    def put(self, diagram: Diagram, image: bytes, output_format: str = "png"):
+        """
+        Stores the image of a diagram
+        """
+        key = diagram_key(diagram, output_format)
+        file_name = self._file_name(key, output_format)
+        with self._lock:
+            self._load()
+            path = self._path(file_name)
+            temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(temporary_path, "wb") as image_file:
+                    image_file.write(image)
+                os.replace(temporary_path, path)
+            except BaseException:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+                raise
+
+            self._size -= self._entries.pop(file_name, 0)
+            self._entries[file_name] = len(image)
+            self._size += len(image)
+            self._evict()
+        return self
+
+    def render(self, diagram: Diagram, output_format: str = "png") -> bytes:
+        """
+        The image of a diagram, rendered only when not cached
+        """
+        return self.render_many([diagram], output_format)[0]
+
+    def render_many(
+        self, diagrams: Iterable[Diagram], output_format: str = "png"
+    ) -> List[bytes]:
+        """
+        The images of many diagrams, in order.
+
+        The diagrams not cached are rendered in one stream, identical
+        diagrams once.
+        """
+        texts = [diagram_text(diagram) for diagram in diagrams]
+        images = [self.get(text, output_format) for text in texts]
+
+        # PlantUML text -> image, of the diagrams to render
+        missing = {text: None for text, image in zip(texts, images) if image is None}
+        # a duplicate of a missing diagram is not in the cache either
+        misses = sum(1 for image in images if image is None)
+        self.hits += len(texts) - misses
+        self.misses += misses
+
+        if len(missing) != 0:
+            renderer = self.renderer_factory(output_format)
+            for text, image in zip(missing, renderer.render_many(list(missing))):
+                self.put(text, image, output_format)
+                missing[text] = image
+
+        return [
+            missing[text] if image is None else image
+            for text, image in zip(texts, images)
+        ]
+
+    def render_to_files(
+        self,
+        diagrams: Iterable[Diagram],
+        paths: List[str],
+        output_format: str = "png",
+    ) -> List[str]:
+        """
+        Writes the images of many diagrams, rendering only the changed ones
+        """
+        diagrams = list(diagrams)
+        if len(diagrams) != len(paths):
+            raise Exception(
+                "{} diagrams for {} paths".format(len(diagrams), len(paths))
+            )
+
+        for image, path in zip(self.render_many(diagrams, output_format), paths):
+            directory = os.path.dirname(path)
+            if directory != "":
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "wb") as image_file:
+                image_file.write(image)
+        return paths
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """
+        Bytes of the images in the cache
+        """
+        with self._lock:
+            self._load()
+            return self._size
+
+    def clear(self):
+        with self._lock:
+            self._load()
+            for file_name in self._entries:
+                try:
+                    os.remove(self._path(file_name))
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._size = 0
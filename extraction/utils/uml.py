@@ -4,25 +4,203 @@
 # Class with attributes, but no methods
 # Simple associations between classes including multiplicity and names
 
+import hashlib
 from io import TextIOWrapper
 import os
-from typing import List, Tuple
+import sys
+import threading
+from typing import List, NamedTuple, Optional, Tuple
 import networkx
 
 
+# bytes of the structural digests
+DIGEST_SIZE = 16
+
+
+def as_text(value) -> Optional[str]:
+    """
+    A name as str, None stays None. Names can be other objects, like a
+    UMLClass for the package name.
+    """
+    if value is None or type(value) is str:
+        return value
+    return str(value)
+
+
+def _intern(value):
+    # names repeat across the fragments of a corpus, keep one copy of each
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+class Attribute(NamedTuple):
+    """
+    An attribute of a class, a (name, type) tuple
+    """
+
+    name: str
+    attribute_type: Optional[str]
+
+
+class Association(NamedTuple):
+    """
+    An association to another class, a (dest, mult, name) tuple
+    """
+
+    destination: "UMLClass"
+    multiplicity: str
+    name: str
+
+
+class AttributeList(list):
+    """
+    The attributes of a class, with the position of the first attribute of
+    every name. The positions are built on the first lookup, most classes
+    never need them, and kept up to date by append. Any other change drops
+    them until the next lookup.
+    """
+
+    __slots__ = ("_index",)
+
+    def __init__(self, attributes=()) -> None:
+        super().__init__(attributes)
+        self._index: Optional[dict[str, int]] = None
+
+    def position(self, name: str) -> Optional[int]:
+        """
+        Position of the first attribute of this name, None if absent
+        """
+        if self._index is None:
+            self._index = {}
+            for position, attribute in enumerate(self):
+                self._index.setdefault(attribute[0], position)
+        return self._index.get(name)
+
+    def append(self, attribute):
+        if self._index is not None:
+            self._index.setdefault(attribute[0], len(self))
+        super().append(attribute)
+
+    def __setitem__(self, key, value):
+        self._index = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._index = None
+        super().__delitem__(key)
+
+    def __iadd__(self, attributes):
+        self._index = None
+        return super().__iadd__(attributes)
+
+    def __imul__(self, count):
+        self._index = None
+        return super().__imul__(count)
+
+    def extend(self, attributes):
+        self._index = None
+        super().extend(attributes)
+
+    def insert(self, position, attribute):
+        self._index = None
+        super().insert(position, attribute)
+
+    def pop(self, position=-1):
+        self._index = None
+        return super().pop(position)
+
+    def remove(self, attribute):
+        self._index = None
+        super().remove(attribute)
+
+    def clear(self):
+        self._index = None
+        super().clear()
+
+    def sort(self, *args, **kwargs):
+        self._index = None
+        super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self._index = None
+        super().reverse()
+
+
 class UMLClass:
+    __slots__ = ("name", "kind", "associations", "_attributes")
+
     def __init__(self, name: str, kind: str) -> None:
-        self.name = name
+        self.name = _intern(name)
         # name, type
-        self.attributes: List[Tuple[str, str]] = []
+        self.attributes: List[Attribute] = []
         # dest, mult, name
-        self.associations: List[Tuple["UMLClass", str, str]] = []
-        self.kind = kind
+        self.associations: List[Association] = []
+        self.kind = _intern(kind)
+
+    @property
+    def attributes(self) -> AttributeList:
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes: List[Tuple[str, str]]):
+        # a copy, the class keeps the positions of its own list
+        self._attributes = AttributeList(attributes)
+
+    def attribute_position(self, name: str) -> Optional[int]:
+        """
+        Position of the attribute of this name in attributes, None if absent
+        """
+        return self._attributes.position(name)
 
     def attribute(self, name: str, attribute_type: str):
-        self.attributes.append((name, attribute_type))
+        self._attributes.append(Attribute(_intern(name), _intern(attribute_type)))
+        return self
+
+    def merge_attribute(self, name: str, attribute_type: str):
+        """
+        Adds an attribute unless one of that name exists. When it exists
+        without a type, it takes this type.
+        """
+        position = self.attribute_position(name)
+
+        # attribute not in this class
+        if position is None:
+            return self.attribute(name, attribute_type)
+
+        # if types collide, the existing type stays
+        # no type assigned to the existing attr, take the incoming type
+        if self._attributes[position][1] is None:
+            # same name at the same position, the positions stay valid
+            list.__setitem__(
+                self._attributes,
+                position,
+                Attribute(self._attributes[position][0], _intern(attribute_type)),
+            )
         return self
 
+    def __getstate__(self):
+        # plain tuples, records pickle with a reference to their class each
+        return {
+            "name": self.name,
+            "attributes": [tuple(attribute) for attribute in self.attributes],
+            "associations": [tuple(association) for association in self.associations],
+            "kind": self.kind,
+        }
+
+    def __setstate__(self, state):
+        # also reads the plain tuples of the pickles from before the records
+        self.name = _intern(state["name"])
+        self.kind = _intern(state["kind"])
+        self.attributes = [
+            Attribute(_intern(name), _intern(attribute_type))
+            for name, attribute_type in state["attributes"]
+        ]
+        self.associations = [
+            Association(destination, _intern(multiplicity), _intern(name))
+            for destination, multiplicity, name in state["associations"]
+        ]
+
     def association(self, destination: "UMLClass", multiplicity="", name="") -> None:
         # multiplicity can be
         # "1..1": one to one
@@ -30,24 +208,34 @@ class UMLClass:
         # "0..*": zero or many
         # "1..*": one or many
         # "": none
-        self.associations.append((destination, multiplicity, name))
+        self.associations.append(
+            Association(destination, _intern(multiplicity), _intern(name))
+        )
 
     def _to_plantuml(self, file_object: TextIOWrapper):
-        print(f"class {self.name}", file=file_object)
+        lines = []
+        self._plantuml_lines(lines)
+        file_object.write("".join(lines))
+
+    def _plantuml_lines(self, lines: List[str]):
+        """
+        Appends the PlantUML lines of the class, newlines included
+        """
+        lines.append(f"class {self.name}\n")
 
         if self.kind == "class":
-            self._class_to_plantuml(file_object)
+            self._class_plantuml_lines(lines)
             if len(self.associations) != 0:
-                self._associations_to_plantuml(file_object)
+                self._associations_plantuml_lines(lines)
 
         elif self.kind == "association":
-            self._associations_to_plantuml(file_object)
+            self._associations_plantuml_lines(lines)
 
         else:
-            self._class_to_plantuml(file_object)
-            self._associations_to_plantuml(file_object)
+            self._class_plantuml_lines(lines)
+            self._associations_plantuml_lines(lines)
 
-    def _associations_to_plantuml(self, file_object):
+    def _associations_plantuml_lines(self, lines: List[str]):
         for association in self.associations:
             destination, multiplicity, name = association
 
@@ -65,69 +253,235 @@ class UMLClass:
             if name != "":
                 association += f" : {name}"
 
-            print(association, file=file_object)
+            lines.append(association + "\n")
 
-    def _class_to_plantuml(self, file_object):
-        print("{", file=file_object)
+    def _class_plantuml_lines(self, lines: List[str]):
+        lines.append("{\n")
         for attribute in self.attributes:
 
             attribute_name = attribute[0]
             attribute_type = attribute[1]
 
             if attribute_type == None:
-                print(f"{attribute_name}", file=file_object)
+                lines.append(f"{attribute_name}\n")
             else:
-                print(f"{attribute_name} : {attribute_type}", file=file_object)
-        print("}", file=file_object)
+                lines.append(f"{attribute_name} : {attribute_type}\n")
+        lines.append("}\n")
 
     def __str__(self) -> str:
         return self.name
 
+    def digest(self) -> bytes:
+        """
+        Structural digest of the class: name, kind, attributes and
+        associations, in order.
+
+        Destinations of associations count by name, so the digest does not
+        recurse through the associations and cycles are not an issue.
+        """
+        structure = (
+            as_text(self.name),
+            as_text(self.kind),
+            [
+                (as_text(name), as_text(attribute_type))
+                for name, attribute_type in self.attributes
+            ],
+            [
+                (
+                    as_text(destination.name),
+                    as_text(multiplicity),
+                    as_text(name),
+                )
+                for destination, multiplicity, name in self.associations
+            ],
+        )
+        return hashlib.blake2b(
+            repr(structure).encode(), digest_size=DIGEST_SIZE
+        ).digest()
+
     def __eq__(self, __o: "UMLClass") -> bool:
         if type(__o) != UMLClass:
             return False
 
-        if self.name != __o.name:
-            return False
+        if self is __o:
+            return True
 
-        if self.kind != __o.kind:
-            return False
+        return self.digest() == __o.digest()
+
+    def __hash__(self) -> int:
+        # follows the content, do not change a class while it is in a set. Not
+        # cached as classes change in place, every call digests the whole class
+        return int.from_bytes(self.digest()[:8], "little")
 
-        if self.kind == "class":
-            for attr1, attr2 in zip(self.attributes, __o.attributes):
-                if attr1 != attr2:
-                    return False
-            return True
-        else:
-            # might become an infinite recursion
-            for rel1, rel2 in zip(self.associations, __o.associations):
-                if rel1 != rel2:
-                    return False
-            return True
+
+def unflatten_classes(flat: List[tuple], count: Optional[int] = None) -> List[UMLClass]:
+    """
+    The classes of UML.flat_classes, with their associations between them.
+
+    Returns the first count classes, all of them by default, the others are
+    only reached through associations.
+    """
+    classes = []
+    for name, kind, attributes, _ in flat:
+        uml_class = UMLClass(name, kind)
+        for attribute_name, attribute_type in attributes:
+            uml_class.attribute(attribute_name, attribute_type)
+        classes.append(uml_class)
+
+    for uml_class, (_, _, _, associations) in zip(classes, flat):
+        for destination, multiplicity, name in associations:
+            # pickles from before the external destinations were flat keep them
+            if isinstance(destination, int):
+                destination = classes[destination]
+            uml_class.association(destination, multiplicity, name)
+
+    return classes[:count]
 
 
 class UML:
+    __slots__ = ("package_name", "classes")
+
     def __init__(self, package_name: str) -> None:
-        self.package_name = package_name
+        self.package_name = _intern(package_name)
         self.classes: List[UMLClass] = []
 
+    def copy(self) -> "UML":
+        """
+        Copy of the model whose classes, attributes and associations can be
+        changed without affecting this one
+        """
+        copied_classes = {
+            id(uml_class): UMLClass(uml_class.name, uml_class.kind)
+            for uml_class in self.classes
+        }
+
+        for uml_class in self.classes:
+            copied_class = copied_classes[id(uml_class)]
+            # the setter copies
+            copied_class.attributes = uml_class.attributes
+            for destination, multiplicity, name in uml_class.associations:
+                copied_class.association(
+                    copied_classes.get(id(destination), destination), multiplicity, name
+                )
+
+        copied = UML(self.package_name)
+        copied.classes = [copied_classes[id(uml_class)] for uml_class in self.classes]
+        return copied
+
+    def flat_classes(self) -> List[tuple]:
+        """
+        The classes as (name, kind, attributes, associations) tuples that do
+        not refer to each other. Attributes are (name, type) tuples,
+        associations (destination, multiplicity, name) tuples with destination
+        the position of the class in the list.
+
+        Destinations that are not classes of the model follow the classes of
+        the model, see unflatten_classes.
+        """
+        ordered = list(self.classes)
+        positions = {}
+        for position, uml_class in enumerate(ordered):
+            positions.setdefault(id(uml_class), position)
+
+        flat = []
+        # the list grows while it is read, with the external destinations
+        position = 0
+        while position < len(ordered):
+            uml_class = ordered[position]
+            position += 1
+
+            associations = []
+            for destination, multiplicity, name in uml_class.associations:
+                if id(destination) not in positions:
+                    positions[id(destination)] = len(ordered)
+                    ordered.append(destination)
+                associations.append((positions[id(destination)], multiplicity, name))
+
+            attributes = [tuple(attribute) for attribute in uml_class.attributes]
+            flat.append((uml_class.name, uml_class.kind, attributes, associations))
+
+        return flat
+
+    def __getstate__(self):
+        # flat state, pickling the class graph as is recurses once per association
+        return {
+            "package_name": self.package_name,
+            "classes": self.flat_classes(),
+            "count": len(self.classes),
+        }
+
+    def __setstate__(self, state):
+        self.package_name = _intern(state["package_name"])
+
+        # pickled before the flat state
+        if len(state["classes"]) == 0 or isinstance(state["classes"][0], UMLClass):
+            self.classes = state["classes"]
+            return
+
+        self.classes = unflatten_classes(state["classes"], state.get("count"))
+
     def save(self, path: str):
+        """
+        Writes the PlantUML of the model to a file.
 
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        file_object = open(path, "w")
-        self._to_plantuml(file_object)
-        file_object.close()
+        The file is written next to its destination and renamed over it, so
+        readers never see a partial file, even with concurrent writers.
+        """
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        # unique per process and thread, "x" fails rather than share it
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "x") as file_object:
+                self.write(file_object)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
 
         return self
 
+    def to_string(self) -> str:
+        """
+        The PlantUML of the model
+        """
+        lines = []
+        self._plantuml_lines(lines)
+        return "".join(lines)
+
+    def write(self, stream):
+        """
+        Writes the PlantUML of the model to a text stream, in one write
+        """
+        stream.write(self.to_string())
+        return self
+
     # https://plantuml.com/class-diagram
     def _to_plantuml(self, file_object):
+        self.write(file_object)
 
-        print("@startuml", file=file_object)
-        print("!theme plain", file=file_object)
+    def _plantuml_lines(self, lines: List[str]):
+        lines.append("@startuml\n")
+        lines.append("!theme plain\n")
         for c in self.classes:
-            c._to_plantuml(file_object=file_object)
-        print("@enduml", file=file_object)
+            c._plantuml_lines(lines)
+        lines.append("@enduml\n")
+
+    def digest(self) -> bytes:
+        """
+        Structural digest of the model, over the digests of its classes in
+        order. The package name is not part of it, like for equality.
+
+        Linear in the size of the model. Two models with the same digest
+        render the same.
+        """
+        digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+        for uml_class in self.classes:
+            digest.update(uml_class.digest())
+        return digest.digest()
 
     def __eq__(self, __o: "UML") -> bool:
         if type(__o) != UML:
@@ -137,11 +491,20 @@ class UML:
         if len(self.classes) != len(__o.classes):
             return False
 
-        for eclass1, eclass2 in zip(self.classes, __o.classes):
-            if eclass1 != eclass2:
-                return False
+        return self.digest() == __o.digest()
+
+    def __hash__(self) -> int:
+        # follows the content, do not change a model while it is in a set. Not
+        # cached as models change in place, every call digests the whole model
+        return int.from_bytes(self.digest()[:8], "little")
+
+    def to_ecore(self):
+        """
+        The model as a pyecore EPackage, see uml2ecore
+        """
+        from .uml2ecore import to_epackage
 
-        return True
+        return to_epackage(self)
 
     def get_graph_object(self):
         """
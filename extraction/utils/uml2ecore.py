@@ -0,0 +1,250 @@
+"""
+Exports uml models to Ecore, the reverse of inquire.PlantUMLSwitch.
+
+Classes become EClasses, attributes EAttributes and associations
+EReferences. Classes of the same name share one EClass. Of the attributes
+of a name the first wins, like in merge_attributes. Associations are all
+kept, a reference whose name is taken is numbered, like items2.
+"""
+
+import io
+import os
+import re
+import threading
+from typing import List, Optional
+
+import pyecore.ecore as ecore
+from pyecore.resources import URI, ResourceSet
+
+from . import uml
+from .uml import as_text
+
+# ecore data types by name, EInt, EString, ...
+ECORE_TYPES = {
+    classifier.name: classifier
+    for classifier in ecore.eClass.eClassifiers
+    if isinstance(classifier, ecore.EDataType)
+}
+
+# the usual type names of the PlantUML fragments
+TYPE_ALIASES = {
+    "string": ecore.EString,
+    "str": ecore.EString,
+    "text": ecore.EString,
+    "int": ecore.EInt,
+    "integer": ecore.EInt,
+    "long": ecore.ELong,
+    "short": ecore.EShort,
+    "byte": ecore.EByte,
+    "char": ecore.EChar,
+    "float": ecore.EFloat,
+    "double": ecore.EDouble,
+    "real": ecore.EDouble,
+    "number": ecore.EDouble,
+    "bool": ecore.EBoolean,
+    "boolean": ecore.EBoolean,
+    "date": ecore.EDate,
+}
+
+# attributes without type
+DEFAULT_TYPE = ecore.EString
+
+
+def _text(value) -> str:
+    return as_text(value) or ""
+
+
+def ecore_name(value, default: str = "unnamed") -> str:
+    """
+    A valid Ecore name from a uml name, letters, digits and underscores
+    """
+    name = re.sub(r"\W+", "_", _text(value)).strip("_")
+    if name == "":
+        return default
+    if name[0].isdigit():
+        name = "_" + name
+    return name
+
+
+def split_multiplicity(multiplicity) -> tuple[int, int]:
+    """
+    (lower, upper) bounds of a "lower..upper" multiplicity, upper -1 for "*".
+    No multiplicity is 0..1.
+    """
+    bounds = _text(multiplicity).split("..")
+    if bounds == [""]:
+        return 0, 1
+    if len(bounds) == 1:
+        bounds = bounds * 2
+
+    def bound(text, default):
+        text = text.strip()
+        if text == "*":
+            return -1
+        return int(text) if text.isdigit() else default
+
+    lower = bound(bounds[0], 0)
+    return max(lower, 0), bound(bounds[1], 1)
+
+
+class BufferURI(URI):
+    """
+    URI whose resource is saved to memory, in buffer
+    """
+
+    def __init__(self, uri: str) -> None:
+        super().__init__(uri)
+        self.buffer = io.BytesIO()
+
+    def create_outstream(self):
+        return self.buffer
+
+    def close_stream(self):
+        pass
+
+
+def _unique(name: str, taken: set) -> str:
+    unique = name
+    number = 1
+    while unique in taken:
+        number += 1
+        unique = f"{name}{number}"
+    taken.add(unique)
+    return unique
+
+
+def to_epackage(model: uml.UML, ns_uri: Optional[str] = None) -> ecore.EPackage:
+    """
+    The model as an EPackage, in memory
+    """
+    package_name = ecore_name(model.package_name, "model")
+    package = ecore.EPackage(
+        package_name,
+        nsURI=ns_uri or f"http://{package_name}",
+        nsPrefix=package_name.lower(),
+    )
+
+    # uml class name -> eclass
+    eclasses: dict[str, ecore.EClass] = {}
+    # names of the classifiers and features of each eclass
+    classifier_names = set()
+    feature_names: dict[int, set] = {}
+    # type name -> data type declared in the package
+    data_types: dict[str, ecore.EDataType] = {}
+
+    def eclass_of(uml_class: uml.UMLClass) -> ecore.EClass:
+        key = _text(uml_class.name)
+        eclass = eclasses.get(key)
+        if eclass is None:
+            eclass = ecore.EClass(
+                _unique(ecore_name(uml_class.name), classifier_names)
+            )
+            package.eClassifiers.append(eclass)
+            eclasses[key] = eclass
+            feature_names[id(eclass)] = set()
+        return eclass
+
+    def data_type_of(attribute_type) -> ecore.EDataType:
+        if attribute_type is None or _text(attribute_type).strip() == "":
+            return DEFAULT_TYPE
+
+        type_name = _text(attribute_type).strip()
+        data_type = ECORE_TYPES.get(type_name) or TYPE_ALIASES.get(type_name.lower())
+        if data_type is not None:
+            return data_type
+
+        data_type = data_types.get(type_name)
+        if data_type is None:
+            data_type = ecore.EDataType(
+                _unique(ecore_name(type_name), classifier_names),
+                instanceClassName="java.lang.Object",
+            )
+            package.eClassifiers.append(data_type)
+            data_types[type_name] = data_type
+        return data_type
+
+    for uml_class in model.classes:
+        eclass_of(uml_class)
+
+    for uml_class in model.classes:
+        eclass = eclass_of(uml_class)
+        taken = feature_names[id(eclass)]
+
+        for name, attribute_type in uml_class.attributes:
+            name = ecore_name(name, "attribute")
+            if name in taken:
+                continue
+            taken.add(name)
+            eclass.eStructuralFeatures.append(
+                ecore.EAttribute(name, data_type_of(attribute_type))
+            )
+
+        for destination, multiplicity, name in uml_class.associations:
+            # destinations outside the model get an eclass too
+            destination_eclass = eclass_of(destination)
+            lower, upper = split_multiplicity(multiplicity)
+            default_name = (
+                destination_eclass.name[:1].lower() + destination_eclass.name[1:]
+            )
+            eclass.eStructuralFeatures.append(
+                ecore.EReference(
+                    _unique(ecore_name(name, default_name), taken),
+                    destination_eclass,
+                    lower=lower,
+                    upper=upper,
+                )
+            )
+
+    return package
+
+
+def to_xmi(model: uml.UML) -> bytes:
+    """
+    The XMI of the model's EPackage, the content of an .ecore file
+    """
+    uri = BufferURI(ecore_name(model.package_name, "model") + ".ecore")
+    resource = ResourceSet().create_resource(uri)
+    resource.append(to_epackage(model))
+    resource.save()
+    return uri.buffer.getvalue()
+
+
+def save_ecore(model: uml.UML, path: str):
+    """
+    Writes the model to an .ecore file
+    """
+    return export_ecore([model], [path])[0]
+
+
+def export_ecore(models: List[uml.UML], paths: List[str]) -> List[str]:
+    """
+    Writes many models to .ecore files, each through its own resource set, so
+    nothing is kept between models and no reference crosses files.
+
+    Each file is written next to its path and renamed over it.
+    """
+    if len(models) != len(paths):
+        raise Exception("{} models for {} paths".format(len(models), len(paths)))
+
+    for model, path in zip(models, paths):
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        uri = BufferURI(path)
+        resource = ResourceSet().create_resource(uri)
+        resource.append(to_epackage(model))
+        resource.save()
+
+        # unique per process and thread, "x" fails rather than share it
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporary_path, "xb") as ecore_file:
+                ecore_file.write(uri.buffer.getvalue())
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    return paths
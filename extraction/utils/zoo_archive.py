@@ -0,0 +1,232 @@
+"""
+The model zoo packed in one file, read through mmap.
+
+Every .plantuml, .json and .ecore file of the zoo is parsed once when
+packing and stored as a compact record (see archive.to_record) under its
+file name. Reading a model slices the mapped file and decodes that record
+only, processes reading the same archive share the page cache.
+
+The modification time and size of every source file are kept too. A
+record whose file changed since packing is stale, see ZooArchive.is_current.
+
+Layout:
+- magic and version, struct "<6sH"
+- length of the header, struct "<Q"
+- the header, JSON {"entries": {file name: [offset, length, mtime_ns, size]}},
+  offsets from the end of the header
+- the records
+
+Usage: python -m extraction.utils.zoo_archive zoo_dir archive_path
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from . import uml
+from .archive import from_record, to_record
+
+MAGIC = b"UMLZOO"
+VERSION = 2
+PREFIX = struct.Struct("<6sH")
+HEADER_LENGTH = struct.Struct("<Q")
+
+EXTENSIONS = (".plantuml", ".json", ".ecore")
+
+
+def load_zoo_file(path: str) -> uml.UML:
+    """
+    Parses a zoo file the way inquire reads it
+    """
+    # inquire reads the csv files and imports pyecore, only needed to pack
+    from . import inquire
+
+    if path.endswith(".plantuml"):
+        return inquire.get_plantuml_uml(path)
+    if path.endswith(".json"):
+        return inquire.load_json_uml(path)
+    if path.endswith(".ecore"):
+        return inquire.load_ecore_uml(path)
+    raise Exception("Unexpected zoo file: {}".format(path))
+
+
+def source_stat(path: str) -> List[int]:
+    """
+    [mtime_ns, size] of a zoo file, what the archive compares to detect changes
+    """
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _encode_zoo_file(path: str) -> Tuple[Optional[bytes], List[int], Optional[str]]:
+    # taken before parsing, a change while parsing makes the record stale
+    stat = source_stat(path)
+    try:
+        record = to_record(load_zoo_file(path))
+    except Exception as error:
+        return None, stat, f"{type(error).__name__}: {error}"
+    record = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+    return record.encode(), stat, None
+
+
+def pack_zoo(
+    zoo_dir: str,
+    path: str,
+    extensions=EXTENSIONS,
+    max_workers: int = None,
+) -> List[Tuple[str, str]]:
+    """
+    Packs the zoo files with these extensions into an archive, parsing them
+    in a process pool.
+
+    Returns (path, error) pairs of the files that could not be parsed, they
+    are left out.
+    """
+    file_names = sorted(
+        file_name
+        for file_name in os.listdir(zoo_dir)
+        if file_name.endswith(tuple(extensions))
+    )
+    paths = [os.path.join(zoo_dir, file_name) for file_name in file_names]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        encoded = list(executor.map(_encode_zoo_file, paths, chunksize=64))
+
+    entries = {}
+    records = []
+    offset = 0
+    failed = []
+    for file_name, file_path, (record, stat, error) in zip(
+        file_names, paths, encoded
+    ):
+        if record is None:
+            failed.append((file_path, error))
+            continue
+        entries[file_name] = [offset, len(record)] + stat
+        records.append(record)
+        offset += len(record)
+
+    header = json.dumps({"entries": entries}, separators=(",", ":")).encode()
+
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+
+    # written next to the archive and renamed over it, readers never see half of it
+    temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary_path, "xb") as archive_file:
+            archive_file.write(PREFIX.pack(MAGIC, VERSION))
+            archive_file.write(HEADER_LENGTH.pack(len(header)))
+            archive_file.write(header)
+            for record in records:
+                archive_file.write(record)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+    return failed
+
+
+class ZooArchive:
+    """
+    Read only access to a packed zoo, by file name like "CFG.plantuml"
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as archive_file:
+            self._map = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version = PREFIX.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise Exception("Not a packed zoo: {}".format(self.path))
+        if version != VERSION:
+            raise Exception(
+                "Packed zoo version {} in {}, pack it again".format(
+                    version, self.path
+                )
+            )
+
+        (header_length,) = HEADER_LENGTH.unpack_from(self._map, PREFIX.size)
+        header_start = PREFIX.size + HEADER_LENGTH.size
+        self._records_start = header_start + header_length
+        header = json.loads(self._map[header_start : self._records_start])
+
+        # file name -> offset, length, mtime_ns and size of the source
+        self.entries: dict[str, List[int]] = header["entries"]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, file_name: str) -> bool:
+        return file_name in self.entries
+
+    def names(self) -> List[str]:
+        return list(self.entries)
+
+    def is_current(self, file_name: str, zoo_dir: str) -> bool:
+        """
+        Whether the record of a file matches the file in zoo_dir, False when
+        the file is not packed, was changed or removed since
+        """
+        entry = self.entries.get(file_name)
+        if entry is None:
+            return False
+        try:
+            return source_stat(os.path.join(zoo_dir, file_name)) == entry[2:]
+        except OSError:
+            return False
+
+    def read(self, file_name: str) -> uml.UML:
+        """
+        The model of a zoo file, a new object at every call
+        """
+        offset, length = self.entries[file_name][:2]
+        start = self._records_start + offset
+        return from_record(json.loads(self._map[start : start + length]))
+
+    def get(self, file_name: str) -> Optional[uml.UML]:
+        if file_name not in self.entries:
+            return None
+        return self.read(file_name)
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self) -> "ZooArchive":
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+    # workers of a process pool map the archive again rather than copying it
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self._open()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m extraction.utils.zoo_archive zoo_dir archive_path")
+        exit(1)
+
+    failed = pack_zoo(sys.argv[1], sys.argv[2])
+    print("Packed", sys.argv[1], "into", sys.argv[2])
+    if len(failed) != 0:
+        print("Left out", len(failed), "files that could not be parsed")
+        for file_path, error in failed:
+            print(file_path, error, file=sys.stderr)
@@ -11,33 +11,45 @@ if __name__ == "__main__":
         exit(1)
     SOURCE_DIR = argv[1]
 
+# number of labels read from disk at once
+CHUNK_SIZE = 100_000
 
-def prepare_test_set():
+
+def prepare_test_set(chunk_size: int = CHUNK_SIZE):
     """
     Creates a csv where the entries are:
     model name, labels from all fragments
     """
 
-    LABELS = pandas.read_csv(os.path.join(SOURCE_DIR, "labels.csv"))
-    FRAGMENTS = pandas.read_csv(os.path.join(SOURCE_DIR, "fragments.csv"))
-
-    grouped: dict[str, str] = {}  # key: model name, text
+    FRAGMENTS = pandas.read_csv(
+        os.path.join(SOURCE_DIR, "fragments.csv"), usecols=["unique_id", "model"]
+    )
+    LABELS = pandas.read_csv(
+        os.path.join(SOURCE_DIR, "labels.csv"),
+        usecols=["fragment_id", "label"],
+        chunksize=chunk_size,
+    )
 
-    for index, row in LABELS.iterrows():
-        fragment = FRAGMENTS.loc[FRAGMENTS["unique_id"] == row["fragment_id"]]
+    # key: model name, item: texts of its labels, in order of appearance
+    grouped_texts: dict[str, list[str]] = {}
 
-        model_name = fragment["model"].values[0]
-
-        text: str = row["label"]
+    for chunk in LABELS:
+        # a left merge keeps the order of the labels
+        chunk = chunk.merge(
+            FRAGMENTS, how="left", left_on="fragment_id", right_on="unique_id"
+        )
 
         # add punctuation
-        if not text.endswith("."):
-            text += "."
+        text = chunk["label"]
+        chunk["label"] = text.where(text.str.endswith("."), text + ".")
+
+        # models are kept in order of first appearance
+        for model_name, texts in chunk.groupby("model", sort=False)["label"]:
+            grouped_texts.setdefault(model_name, []).extend(texts)
 
-        if model_name in grouped:
-            grouped[model_name] += " " + text
-        else:
-            grouped[model_name] = text
+    grouped: dict[str, str] = {
+        model_name: " ".join(texts) for model_name, texts in grouped_texts.items()
+    }  # key: model name, text
 
     return grouped
 
@@ -45,10 +57,7 @@ def prepare_test_set():
 if __name__ == "__main__":
     grouped = prepare_test_set()
 
-    models = []
-    texts = []
-    for key, item in grouped.items():
-        models.append(key)
-        texts.append(item)
-    grouped_frame = pandas.DataFrame(data={"model": models, "text": texts})
+    grouped_frame = pandas.DataFrame(
+        data={"model": list(grouped.keys()), "text": list(grouped.values())}
+    )
     grouped_frame.to_csv("data/grouped.csv")
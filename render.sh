@@ -1,4 +1,4 @@
 #!/bin/bash
 
-plantuml=~/Documents/My\ Documents/Scripts/Libs/plantuml/plantuml-1.2021.16.jar # where your plantuml.jar is
+plantuml="${PLANTUML_JAR:?set PLANTUML_JAR to where your plantuml.jar is}"
 java -jar "$plantuml" "$@" # make sure you have plantuml
\ No newline at end of file